@@ -0,0 +1,173 @@
+# Whole-program points-to analysis answering alias queries of RaceFinder.
+# Constraints of all functions of the callgraph are generated and solved
+# once. Formal parameters include actual arguments of every call and of
+# pthread_create, results of calls include returned values of the callee,
+# so pointers get locations of all contexts they are used in.
+import gcc
+
+from lowering import variable_name
+from pointsto import AndersenSolver, SteensgaardSolver
+
+SOLVERS = {
+    'andersen': AndersenSolver,
+    'steensgaard': SteensgaardSolver,
+}
+
+# name of the node of values returned by a function
+RETURN = '<return>'
+# name of the location standing for memory the analyzed code does not see
+UNKNOWN = '<unknown>'
+
+
+class AliasOracle(object):
+    # Nodes of the solver are named by (function, variable) for formals and
+    # locals and by (None, variable) for globals and functions, the same
+    # way RaceFinder resolves names of variables in a function. Global
+    # pointers may point to memory initialized outside of the functions and
+    # if external is True, formals may point to memory of callers in other
+    # units, so they point to UNKNOWN as well.
+
+    def __init__(self, solver='andersen', external=False):
+        self.solver = SOLVERS[solver]()
+        self.external = external
+        self.formals = {}
+        # names of formals and locals of every function
+        self.scopes = {}
+        # names of variables every function refers to
+        self.mentioned = {}
+        self.queries = {}
+
+    def key(self, function, name):
+        if name in self.scopes.get(function, ()):
+            return function, name
+        return None, name
+
+    def node(self, function, value):
+        return self.solver.node(self.key(function, variable_name(value)))
+
+    def build(self, nodes, variables):
+        unknown = self.solver.node((None, UNKNOWN))
+        self.solver.address(unknown, unknown)
+        for variable in variables:
+            if isinstance(variable.decl.type, gcc.PointerType):
+                self.solver.address(self.solver.node((None, variable.decl.name)), unknown)
+
+        functions = [node.decl.function for node in nodes if node.decl.function is not None]
+        for fun in functions:
+            name = fun.decl.name
+            self.formals[name] = [str(decl) for decl in fun.decl.arguments]
+            self.scopes[name] = set(self.formals[name])
+            self.scopes[name].update(str(decl) for decl in fun.local_decls)
+            if self.external:
+                for decl in fun.decl.arguments:
+                    if isinstance(decl.type, gcc.PointerType):
+                        self.solver.address(self.solver.node((name, str(decl))), unknown)
+
+        for fun in functions:
+            mentioned = self.mentioned[fun.decl.name] = set()
+            for block in fun.cfg.basic_blocks:
+                for stat in block.gimple:
+                    self.add_statement(fun.decl.name, stat)
+                    mentioned.update(self.statement_names(stat))
+
+        self.solver.solve()
+
+    def statement_names(self, stat):
+        # Names of variables the statement uses directly, by address or
+        # through a pointer
+        if isinstance(stat, gcc.GimpleAssign):
+            values = [stat.lhs] + list(stat.rhs)
+        elif isinstance(stat, gcc.GimpleCall):
+            values = [stat.lhs] + list(stat.args)
+        elif isinstance(stat, gcc.GimpleReturn):
+            values = [stat.retval]
+        elif isinstance(stat, gcc.GimpleCond):
+            values = [stat.lhs, stat.rhs]
+        else:
+            values = []
+
+        for value in values:
+            if isinstance(value, (gcc.AddrExpr, gcc.MemRef)):
+                value = value.operand
+            if isinstance(value, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+                yield variable_name(value)
+
+    def value_node(self, function, value):
+        # Returns node pointing to the locations value points to or None if
+        # value is not a pointer the analysis follows
+        if isinstance(value, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+            return self.node(function, value)
+
+        # &x
+        if isinstance(value, gcc.AddrExpr):
+            node = self.solver.node()
+            self.solver.address(node, self.node(function, value.operand))
+            return node
+
+        # *x
+        if isinstance(value, gcc.MemRef):
+            node = self.solver.node()
+            self.solver.load(node, self.node(function, value.operand))
+            return node
+
+        return None
+
+    def add_assign(self, function, lhs, rhs):
+        node = self.value_node(function, rhs)
+        if node is None:
+            return
+
+        # *p = ...
+        if isinstance(lhs, gcc.MemRef):
+            self.solver.store(self.node(function, lhs.operand), node)
+        # p = ...
+        elif isinstance(lhs, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+            self.solver.copy(self.node(function, lhs), node)
+
+    def add_statement(self, function, stat):
+        if isinstance(stat, gcc.GimpleAssign) and len(stat.rhs) == 1:
+            self.add_assign(function, stat.lhs, stat.rhs[0])
+
+        elif isinstance(stat, gcc.GimpleReturn) and stat.retval is not None:
+            node = self.value_node(function, stat.retval)
+            if node is not None:
+                self.solver.copy(self.solver.node((function, RETURN)), node)
+
+        elif isinstance(stat, gcc.GimpleCall):
+            fname = str(stat.fndecl)
+            if fname == 'pthread_create':
+                self.bind(function, str(stat.args[2].operand), stat.args[3:4])
+            elif fname in self.formals:
+                self.bind(function, fname, stat.args)
+                if stat.lhs is not None:
+                    self.solver.copy(self.node(function, stat.lhs),
+                                     self.solver.node((fname, RETURN)))
+
+    def bind(self, function, callee, args):
+        # Formals of callee include values of actual arguments, calls of
+        # functions without bodies are not followed
+        for formal, arg in zip(self.formals.get(callee, ()), args):
+            node = self.value_node(function, arg)
+            if node is not None:
+                self.solver.copy(self.solver.node((callee, formal)), node)
+
+    def points_to(self, function, name):
+        # Returns sorted (function, variable) of locations variable of the
+        # function may point to, function is None for globals
+        key = self.key(function, name)
+        locations = self.queries.get(key)
+        if locations is None:
+            node = self.solver.ids.get(key)
+            if node is None:
+                locations = []
+            else:
+                locations = sorted(self.solver.names[location]
+                                   for location in self.solver.points_to(node))
+            self.queries[key] = locations
+        return locations
+
+    def describe(self, function):
+        # Text of the results which analysis of function depends on: points-to
+        # sets of the variables it refers to, the only ones it queries
+        keys = sorted(set(self.key(function, name) for name in self.mentioned.get(function, ())))
+        return ';'.join('{}={}'.format(key, self.points_to(*key)) for key in keys)
@@ -1,95 +1,144 @@
 import json
-import random
+import os
+import sys
 
 import gcc
 
+# gcc executes plugin as a script, so make its neighbours importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-class AliasAnalyzer(gcc.GimplePass):
-    FAKE_RANGE = (0, 100000)
+from pointsto import AndersenSolver, SteensgaardSolver
+from pts_store import PointsToStore
 
-    def execute(self, fun):
-        def init_shared_variable(decl):
-          name = decl.name
-          vtype = decl.type
-          while isinstance(vtype, gcc.PointerType):
-            # analyze each function independant from others so
-            # add faked locations in order to emulate shared pointers
-            # behaviour
-            faked = 'fake{}'.format(random.randint(*self.FAKE_RANGE))
-            pts[name] = set([faked])
-            name, vtype = faked, vtype.type
-          pts[name] = set()
-
-        def eval_lhs(lhs):
-          # x
-          if isinstance(lhs, gcc.VarDecl):
-            return set([lhs.name])
 
-          # *x
-          if isinstance(lhs, gcc.MemRef):
-            return eval_rhs(lhs.operand)
+def plugin_argument(name, default=None):
+    # value of -fplugin-arg-python-<name>=<value> if it was passed to gcc
+    return getattr(gcc, 'argument_dict', {}).get(name, default)
 
-          raise Exception('Unknown lhs type: {}'.format(type(lhs)))
+
+class AliasAnalyzer(gcc.GimplePass):
+    # subset-based analysis, precise but quadratic or worse
+    MODE_ANDERSEN = 'andersen'
+    # unification-based analysis, less precise but almost linear
+    MODE_STEENSGAARD = 'steensgaard'
+    SOLVERS = {
+        MODE_ANDERSEN: AndersenSolver,
+        MODE_STEENSGAARD: SteensgaardSolver,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(AliasAnalyzer, self).__init__(*args, **kwargs)
+        self.mode = plugin_argument('alias-mode', self.MODE_ANDERSEN)
+        if self.mode not in self.SOLVERS:
+            raise Exception('Unknown alias-mode: {}'.format(self.mode))
+        # pointer chains of global variables, computed for the first function
+        # and shared by the others
+        self.globals = None
+        self.fakes = 0
+        # results of all functions are appended to one store if it is set
+        self.store = None
+        store_path = plugin_argument('alias-store')
+        if store_path:
+            self.store = PointsToStore(store_path)
+
+    def pointer_chain(self, decl):
+        # Returns names of decl and of fake locations it points to through
+        # every level of its pointer type. Each function is analyzed
+        # independently from others, so fake locations emulate the memory
+        # shared pointers point to.
+        chain = [decl.name]
+        vtype = decl.type
+        while isinstance(vtype, gcc.PointerType):
+            chain.append('fake{}'.format(self.fakes))
+            self.fakes += 1
+            vtype = vtype.type
+        return chain
+
+    def execute(self, fun):
+        solver = self.SOLVERS[self.mode]()
 
         def eval_rhs(rhs):
+          # returns node which points to the value of rhs
           # x
           if isinstance(rhs, gcc.VarDecl):
-            return pts[rhs.name]
+            return solver.node(rhs.name)
 
           # &x
           if isinstance(rhs, gcc.AddrExpr):
-            return set([rhs.operand.name])
+            node = solver.node()
+            solver.address(node, solver.node(rhs.operand.name))
+            return node
 
           # *x
           if isinstance(rhs, gcc.MemRef):
-            pt = set()
-            for p in eval_rhs(rhs.operand):
-              pt.update(pts[p])
-            return pt
+            node = solver.node()
+            solver.load(node, eval_rhs(rhs.operand))
+            return node
 
           raise Exception('Unknown rhs type: {}'.format(type(rhs)))
 
-        # initialize points-to sets
         # initialize points-to sets
         # initialize points-to sets for local variables
         variables = [decl.name for decl in fun.local_decls if decl.name]
-        pts = {v: set() for v in variables}
-        # initialize points-to sets for global variables
-        for variable in gcc.get_variables():
-          init_shared_variable(variable.decl)
-        # initialize points-to sets for function formal parameters
-        for variable in fun.decl.arguments:
-          init_shared_variable(variable)
-
-        # iterate until fixed point reached
-        changed = True;
-        while changed:
-          changed = False
-          for block in fun.cfg.basic_blocks:
-            for instr in block.gimple:
-              # analyze only assignments operations
-              if not isinstance(instr, gcc.GimpleAssign):
-                continue
-
-              # analyze only next types of expressions
-              if instr.exprcode not in (gcc.VarDecl, gcc.AddrExpr, gcc.MemRef):
-                continue
-
-              # rhs must contain only 1 element
-              if len(instr.rhs) > 1:
-                continue
-
-              lhs = eval_lhs(instr.lhs)
-              rhs = eval_rhs(instr.rhs[0])
-
-              for var in lhs:
-                if not rhs.issubset(pts[var]):
-                  pts[var].update(rhs)
-                  changed = True
+        for name in variables:
+          solver.node(name)
+        # initialize points-to sets for global variables and function
+        # formal parameters
+        if self.globals is None:
+          self.globals = [self.pointer_chain(variable.decl) for variable in gcc.get_variables()]
+        chains = self.globals + [self.pointer_chain(decl) for decl in fun.decl.arguments]
+        for chain in chains:
+          variables.extend(chain)
+          nodes = [solver.node(name) for name in chain]
+          for node, location in zip(nodes, nodes[1:]):
+            solver.address(node, location)
+
+        # generate constraints of assignments once
+        for block in fun.cfg.basic_blocks:
+          for instr in block.gimple:
+            # analyze only assignments operations
+            if not isinstance(instr, gcc.GimpleAssign):
+              continue
+
+            # analyze only next types of expressions
+            if instr.exprcode not in (gcc.VarDecl, gcc.AddrExpr, gcc.MemRef):
+              continue
+
+            # rhs must contain only 1 element
+            if len(instr.rhs) > 1:
+              continue
+
+            lhs, rhs = instr.lhs, instr.rhs[0]
+
+            # x = ...
+            if isinstance(lhs, gcc.VarDecl):
+              node = solver.node(lhs.name)
+              if isinstance(rhs, gcc.AddrExpr):
+                solver.address(node, solver.node(rhs.operand.name))
+              elif isinstance(rhs, gcc.MemRef):
+                solver.load(node, eval_rhs(rhs.operand))
+              else:
+                solver.copy(node, eval_rhs(rhs))
+
+            # *x = ...
+            elif isinstance(lhs, gcc.MemRef):
+              solver.store(eval_rhs(lhs.operand), eval_rhs(rhs))
+
+            else:
+              raise Exception('Unknown lhs type: {}'.format(type(lhs)))
+
+        solver.solve()
+
+        pts = {}
+        for name in variables:
+          pts[name] = [solver.names[node] for node in solver.points_to(solver.node(name))]
+
+        if self.store is not None:
+          self.store.append(fun.decl.name, pts)
+          return
 
         # dump result of function analysis to file
         fname = 'output/{}.pts'.format(fun.decl.name)
-        pts = {k: list(v) for k, v in pts.items()}
         with open(fname, 'w') as fo:
             fo.write(json.dumps(pts))
 
@@ -0,0 +1,74 @@
+# Compares speed and precision of the points-to solvers of aliases.py on
+# random constraint systems.
+#
+#     python benchmarks/alias_modes.py --nodes 2000 --nodes 20000
+#
+# Precision is the average size of points-to sets of named nodes, the
+# unification of Steensgaard can only make them bigger.
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pointsto import AndersenSolver, SteensgaardSolver
+
+SOLVERS = (('andersen', AndersenSolver), ('steensgaard', SteensgaardSolver))
+
+# shares of address, copy, load and store constraints
+KINDS = (('address', 0.2), ('copy', 0.5), ('load', 0.15), ('store', 0.15))
+
+
+def constraints(nodes, per_node, seed):
+    # Yields (kind, p, q) over variables v0 .. v<nodes-1>
+    rng = random.Random(seed)
+    for _ in range(nodes * per_node):
+        choice = rng.random()
+        for kind, share in KINDS:
+            choice -= share
+            if choice < 0:
+                break
+        yield kind, rng.randrange(nodes), rng.randrange(nodes)
+
+
+def run(cls, nodes, system):
+    start = time.time()
+    solver = cls()
+    ids = [solver.node('v{}'.format(index)) for index in range(nodes)]
+    for kind, p, q in system:
+        getattr(solver, kind)(ids[p], ids[q])
+    solver.solve()
+    elapsed = time.time() - start
+
+    pts = [set(solver.names[location] for location in solver.points_to(node)) for node in ids]
+    return elapsed, pts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare points-to solvers')
+    parser.add_argument('--nodes', type=int, action='append',
+                        help='variables of a constraint system, 1000 and 10000 by default')
+    parser.add_argument('--per-node', type=int, default=2,
+                        help='constraints per variable')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print '{:>8} {:<12} {:>10} {:>12}'.format('nodes', 'solver', 'time', 'avg pts')
+    for nodes in args.nodes or (1000, 10000):
+        system = list(constraints(nodes, args.per_node, args.seed))
+        results = {}
+        for name, cls in SOLVERS:
+            elapsed, pts = results[name] = run(cls, nodes, system)
+            print '{:>8} {:<12} {:>9.3f}s {:>12.2f}'.format(
+                nodes, name, elapsed, sum(len(locations) for locations in pts) / float(nodes))
+
+        # every result of Steensgaard must include the one of Andersen
+        for exact, approximation in zip(results['andersen'][1], results['steensgaard'][1]):
+            if not exact.issubset(approximation):
+                raise Exception('Steensgaard misses locations found by Andersen')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# Scaling benchmarks of the analyses over generated programs.
+#
+#     python benchmarks/bench.py --save baseline.json
+#     python benchmarks/bench.py --baseline baseline.json --tolerance 0.2
+#
+# Every pass is run by gcc-pyplugin on the program of every scale point,
+# wall time and peak memory of the compiler process are recorded. Runs are
+# compared with the baseline and the exit status is 1 if any of them got
+# slower or bigger by more than the tolerance.
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSES = ('plugin.py', 'aliases.py', 'relative_locksets.py')
+
+# scale points, each one grows a single parameter of the default program
+SCALES = [
+    ('default', {}),
+    ('functions-40', {'functions': 40}),
+    ('functions-160', {'functions': 160}),
+    ('depth-4', {'depth': 4}),
+    ('depth-6', {'depth': 6}),
+    ('loops-3', {'loops': 3}),
+    ('indirection-3', {'indirection': 3}),
+    ('globals-64', {'globals': 64}),
+    ('mutexes-16', {'mutexes': 16}),
+    ('threads-16', {'threads': 16}),
+]
+
+
+def run_pass(script, source, directory, plugin_args):
+    # Returns wall time and peak memory in KiB of gcc running the pass
+    command = [os.path.join(ROOT, 'gcc-pyplugin'), os.path.join(ROOT, script)]
+    command += ['-fplugin-arg-python-{}'.format(arg) for arg in plugin_args]
+    command += ['-c', source, '-o', os.devnull]
+
+    log = os.path.join(directory, 'log.txt')
+    start = time.time()
+    # gcc runs the pass in cc1, its child, so the command is run from a forked
+    # process whose usage of children covers both of them and nothing else
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        with open(log, 'w') as fo:
+            status = subprocess.call(command, cwd=directory, stdout=fo, stderr=subprocess.STDOUT)
+        memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        os.write(write, '{} {}'.format(status, memory))
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as fi:
+        status, memory = [int(value) for value in fi.read().split()]
+    os.waitpid(pid, 0)
+    elapsed = time.time() - start
+
+    if status != 0:
+        raise Exception('{} failed on {}, see {}'.format(script, source, log))
+
+    return elapsed, memory
+
+
+def run(scales, passes, plugin_args, repeat):
+    results = {}
+    for name, parameters in scales:
+        directory = tempfile.mkdtemp(prefix='bench-')
+        try:
+            # aliases.py writes points-to sets there
+            os.mkdir(os.path.join(directory, 'output'))
+            source = os.path.join(directory, name + '.c')
+            with open(source, 'w') as fo:
+                fo.write(generate(**parameters))
+
+            for script in passes:
+                runs = [run_pass(script, source, directory, plugin_args) for _ in range(repeat)]
+                key = '{}:{}'.format(name, script)
+                results[key] = {
+                    'time': min(elapsed for elapsed, memory in runs),
+                    'memory': max(memory for elapsed, memory in runs),
+                }
+                print '{:<40} {:>10.3f}s {:>10d} KiB'.format(
+                    key, results[key]['time'], results[key]['memory'])
+        finally:
+            shutil.rmtree(directory)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    # Yields (key, metric, baseline value, value) of measurements which grew
+    # over the tolerance
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        for metric in ('time', 'memory'):
+            old, new = baseline[key][metric], results[key][metric]
+            if new > old * (1 + tolerance):
+                yield key, metric, old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run scaling benchmarks of the analyses')
+    parser.add_argument('--scale', action='append', choices=[name for name, _ in SCALES],
+                        help='scale point to run, all by default')
+    parser.add_argument('--pass', dest='passes', action='append', choices=PASSES,
+                        help='pass to run, all by default')
+    parser.add_argument('--arg', action='append', default=[],
+                        help='plugin argument name=value passed to the passes')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of every measurement, the fastest one is kept')
+    parser.add_argument('--baseline', help='file with results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative growth of time and memory')
+    parser.add_argument('--save', help='file the results are written to')
+    args = parser.parse_args()
+
+    scales = [(name, parameters) for name, parameters in SCALES
+              if not args.scale or name in args.scale]
+    results = run(scales, args.passes or PASSES, args.arg, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as fo:
+            json.dump(results, fo, indent=1, sort_keys=True, separators=(',', ': '))
+            fo.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as fi:
+            baseline = json.load(fi)
+        found = False
+        for key, metric, old, new in regressions(results, baseline, args.tolerance):
+            print 'Regression of {} {}: {} -> {}'.format(key, metric, old, new)
+            found = True
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Generator of synthetic pthread programs for benchmarks.
+#
+#     python benchmarks/generate.py --functions 20 --depth 3 --seed 1 > prog.c
+#
+# Every function takes a pointer of the given indirection level to an int,
+# accesses globals and its argument under nested branches and loops, some of
+# the accesses guarded by mutexes, and calls functions generated before it,
+# so the callgraph is acyclic. Thread entries call random functions with
+# addresses of globals and main creates every thread twice.
+import argparse
+import random
+
+# parameters of a generated program and their defaults
+PARAMETERS = (
+    ('functions', 10),     # number of functions besides thread entries and main
+    ('depth', 2),          # depth of nested if/else in a function
+    ('loops', 1),          # nesting of loops in a function
+    ('indirection', 1),    # pointer levels of function arguments
+    ('globals', 4),        # number of global int variables
+    ('mutexes', 2),        # number of global mutexes
+    ('threads', 2),        # number of thread entry points
+    ('statements', 3),     # statements in the innermost block
+    ('seed', 0),
+)
+
+
+class ProgramGenerator(object):
+
+    def __init__(self, functions=10, depth=2, loops=1, indirection=1, globals=4,
+                 mutexes=2, threads=2, statements=3, seed=0):
+        self.functions = functions
+        self.depth = depth
+        self.loops = loops
+        self.indirection = max(1, indirection)
+        self.globals = max(1, globals)
+        self.mutexes = mutexes
+        self.threads = threads
+        self.statements = statements
+        self.random = random.Random(seed)
+        self.lines = []
+
+    def emit(self, level, line):
+        self.lines.append('  ' * level + line)
+
+    def pointer(self, name):
+        return '*' * self.indirection + name
+
+    def generate(self):
+        self.lines = ['#include <stddef.h>', '#include <pthread.h>', '']
+        for idx in range(self.globals):
+            self.emit(0, 'int g{};'.format(idx))
+        for idx in range(self.mutexes):
+            self.emit(0, 'pthread_mutex_t m{};'.format(idx))
+        self.emit(0, '')
+
+        for idx in range(self.functions):
+            self.generate_function(idx)
+        for idx in range(self.threads):
+            self.generate_thread(idx)
+        self.generate_main()
+        return '\n'.join(self.lines) + '\n'
+
+    def generate_function(self, idx):
+        self.emit(0, 'void f{}(int {}) {{'.format(idx, self.pointer('p')))
+        self.emit(1, 'int {};'.format(', '.join(['i{}'.format(n) for n in range(self.loops)] + ['l'])))
+        self.emit(1, 'l = 0;')
+        self.generate_block(idx, 1, self.depth, self.loops)
+        self.emit(0, '}')
+        self.emit(0, '')
+
+    def generate_block(self, idx, level, depth, loops):
+        if loops > 0:
+            var = 'i{}'.format(self.loops - loops)
+            self.emit(level, 'for ({0} = 0; {0} < 10; {0}++) {{'.format(var))
+            self.generate_block(idx, level + 1, depth, loops - 1)
+            self.emit(level, '}')
+            return
+
+        if depth > 0:
+            self.emit(level, 'if ({} > {}) {{'.format(self.pointer('p'), self.random.randint(0, 9)))
+            self.generate_block(idx, level + 1, depth - 1, 0)
+            self.emit(level, '} else {')
+            self.generate_block(idx, level + 1, depth - 1, 0)
+            self.emit(level, '}')
+            return
+
+        for _ in range(self.statements):
+            self.generate_statement(idx, level)
+
+    def generate_statement(self, idx, level):
+        choice = self.random.random()
+        mutex = self.random.randrange(self.mutexes) if self.mutexes else None
+        guarded = mutex is not None and choice < 0.5
+
+        if guarded:
+            self.emit(level, 'pthread_mutex_lock(&m{});'.format(mutex))
+
+        glob = 'g{}'.format(self.random.randrange(self.globals))
+        if idx > 0 and self.random.random() < 0.3:
+            # pass the argument or address of a global further
+            callee = self.random.randrange(idx)
+            if self.indirection == 1 and self.random.random() < 0.5:
+                self.emit(level, 'f{}(&{});'.format(callee, glob))
+            else:
+                self.emit(level, 'f{}(p);'.format(callee))
+        elif self.random.random() < 0.5:
+            self.emit(level, 'l = {} + 1;'.format(self.pointer('p')))
+            self.emit(level, '{} = l;'.format(glob))
+        else:
+            self.emit(level, 'l = {};'.format(glob))
+            self.emit(level, '{} = l + 1;'.format(self.pointer('p')))
+
+        if guarded:
+            self.emit(level, 'pthread_mutex_unlock(&m{});'.format(mutex))
+
+    def generate_thread(self, idx):
+        self.emit(0, 'void *thread{}(void *args) {{'.format(idx))
+        self.emit(1, 'int *p0;')
+        for level in range(1, self.indirection):
+            self.emit(1, 'int {}p{};'.format('*' * (level + 1), level))
+        self.emit(1, 'p0 = (int *) args;')
+        for level in range(1, self.indirection):
+            self.emit(1, 'p{} = &p{};'.format(level, level - 1))
+        for _ in range(min(3, self.functions)):
+            self.emit(1, 'f{}(p{});'.format(self.random.randrange(self.functions),
+                                            self.indirection - 1))
+        self.emit(1, 'return NULL;')
+        self.emit(0, '}')
+        self.emit(0, '')
+
+    def generate_main(self):
+        self.emit(0, 'int main(int argc, char *argv[]) {')
+        self.emit(1, 'pthread_t threads[{}];'.format(max(1, 2 * self.threads)))
+        for idx in range(self.mutexes):
+            self.emit(1, 'pthread_mutex_init(&m{}, NULL);'.format(idx))
+        for idx in range(2 * self.threads):
+            self.emit(1, 'pthread_create(&threads[{}], NULL, thread{}, &g{});'.format(
+                idx, idx // 2, self.random.randrange(self.globals)))
+        self.emit(1, 'return 0;')
+        self.emit(0, '}')
+
+
+def generate(**parameters):
+    return ProgramGenerator(**parameters).generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic pthread program')
+    for name, default in PARAMETERS:
+        parser.add_argument('--' + name, type=int, default=default)
+    args = parser.parse_args()
+    print generate(**vars(args)),
+
+
+if __name__ == '__main__':
+    main()
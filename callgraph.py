@@ -0,0 +1,76 @@
+def strongly_connected_components(keys, successors):
+    # Tarjan's algorithm without recursion. Components are returned in
+    # reverse topological order: each component goes after all components
+    # reachable from it, so callees are placed before their callers.
+    index, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+
+    for root in keys:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        walk = [(root, iter(successors(root)))]
+
+        while walk:
+            key, succs = walk[-1]
+
+            for succ in succs:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    walk.append((succ, iter(successors(succ))))
+                    break
+                if succ in on_stack:
+                    lowlink[key] = min(lowlink[key], index[succ])
+            else:
+                walk.pop()
+                if walk:
+                    parent = walk[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[key])
+
+                if lowlink[key] == index[key]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == key:
+                            break
+                    components.append(component)
+
+    return components
+
+
+class Callgraph(object):
+    # Index of callgraph nodes which have function bodies by their names
+
+    def __init__(self, nodes):
+        self.nodes = {}
+        for node in nodes:
+            if node.decl.function is not None:
+                self.nodes[node.decl.name] = node
+
+    def get(self, name):
+        return self.nodes.get(name)
+
+    def callees(self, name):
+        # names of analyzed functions called from the function
+        callees = []
+        for edge in self.nodes[name].callees:
+            callee = edge.callee.decl.name
+            if callee in self.nodes and callee not in callees:
+                callees.append(callee)
+        return callees
+
+    def bottom_up(self):
+        # Components of the callgraph, every component goes after the
+        # components of functions called from it
+        return strongly_connected_components(sorted(self.nodes), self.callees)
+
+    def is_recursive(self, component):
+        return len(component) > 1 or component[0] in self.callees(component[0])
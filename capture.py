@@ -0,0 +1,158 @@
+# Captures GIMPLE of the compiled unit, so that the analyses can be run on
+# it again by replay.py without the compiler:
+#
+#     ./gcc-pyplugin capture.py -fplugin-arg-python-capture-file=test.capture test.c
+import marshal
+import os
+import sys
+
+import gcc
+
+# gcc executes plugin as a script, so make its neighbours importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from capture_format import (
+    ATTRIBUTES, CAPTURE_VERSION, VALUE_PLAIN, VALUE_TREE, VALUE_CLASS, VALUE_LIST, VALUE_LOCATION,
+)
+
+
+def plugin_argument(name, default=None):
+    # value of -fplugin-arg-python-<name>=<value> if it was passed to gcc
+    return getattr(gcc, 'argument_dict', {}).get(name, default)
+
+
+class CaptureEncoder(object):
+    # Encodes gcc objects as records of the tree table: class name, text
+    # and values of captured attributes. Trees are shared within a snapshot,
+    # but not between them, since gcc reuses memory of collected trees.
+
+    def __init__(self):
+        self.classes = {}
+        self.trees = []
+        self.indices = {}
+
+    def start_snapshot(self):
+        self.indices = {}
+
+    def encode_class(self, cls):
+        name = cls.__name__
+        if name not in self.classes:
+            bases = [base for base in cls.__bases__ if base.__module__ == 'gcc']
+            self.classes[name] = tuple(base.__name__ for base in bases)
+            for base in bases:
+                self.encode_class(base)
+        return name
+
+    def encode(self, value):
+        if isinstance(value, type):
+            return VALUE_CLASS, self.encode_class(value)
+        if isinstance(value, (list, tuple)):
+            return VALUE_LIST, tuple(self.encode(item) for item in value)
+        if type(value).__name__ == 'Location' and type(value).__module__ == 'gcc':
+            return VALUE_LOCATION, value.file, value.line, getattr(value, 'column', None)
+        if type(value).__module__ == 'gcc':
+            return VALUE_TREE, self.encode_tree(value)
+        if value is None or isinstance(value, (bool, int, long, float, str)):
+            return VALUE_PLAIN, value
+        return VALUE_PLAIN, str(value)
+
+    def encode_tree(self, tree):
+        index = self.indices.get(tree)
+        if index is not None:
+            return index
+
+        # reserve the index first, trees can refer to each other
+        index = self.indices[tree] = len(self.trees)
+        self.trees.append(None)
+
+        attributes = []
+        for name in ATTRIBUTES:
+            try:
+                value = getattr(tree, name)
+            except Exception:
+                continue
+            attributes.append((name, self.encode(value)))
+
+        self.trees[index] = (self.encode_class(type(tree)), str(tree), tuple(attributes))
+        return index
+
+    def encode_function(self, fun):
+        blocks = []
+        for block in fun.cfg.basic_blocks:
+            blocks.append((
+                block.index,
+                tuple(self.encode_tree(stat) for stat in block.gimple or ()),
+                tuple(edge.dest.index for edge in block.succs),
+            ))
+
+        return (
+            self.encode_tree(fun.decl),
+            tuple(self.encode_tree(decl) for decl in fun.local_decls),
+            tuple(blocks),
+            fun.cfg.entry.index,
+            fun.cfg.exit.index,
+        )
+
+
+class GimpleCapture(gcc.GimplePass):
+    # Captures GIMPLE of every function after cfg is built, the whole
+    # program is captured and written by the IPA pass
+
+    def __init__(self, encoder, *args, **kwargs):
+        super(GimpleCapture, self).__init__(*args, **kwargs)
+        self.encoder = encoder
+        self.functions = []
+
+    def execute(self, fun):
+        if fun is None:
+            return
+        self.encoder.start_snapshot()
+        self.functions.append(self.encoder.encode_function(fun))
+
+
+class ProgramCapture(gcc.IpaPass):
+
+    def __init__(self, encoder, gimple_capture, *args, **kwargs):
+        super(ProgramCapture, self).__init__(*args, **kwargs)
+        self.encoder = encoder
+        self.gimple_capture = gimple_capture
+        self.path = plugin_argument('capture-file', 'gimple.capture')
+
+    def execute(self, *args, **kwargs):
+        encoder = self.encoder
+        encoder.start_snapshot()
+
+        nodes = gcc.get_callgraph_nodes()
+        positions = dict((node.decl.name, position) for position, node in enumerate(nodes))
+
+        functions, callgraph = [], []
+        for node in nodes:
+            function = None
+            if node.decl.function is not None:
+                function = len(functions)
+                functions.append(encoder.encode_function(node.decl.function))
+            callees = tuple(positions[edge.callee.decl.name] for edge in node.callees)
+            callgraph.append((encoder.encode_tree(node.decl), function, callees))
+
+        variables = tuple(encoder.encode_tree(variable.decl) for variable in gcc.get_variables())
+
+        data = {
+            'version': CAPTURE_VERSION,
+            'classes': encoder.classes,
+            'trees': tuple(encoder.trees),
+            'variables': variables,
+            'passes': {
+                'cfg': tuple(self.gimple_capture.functions),
+                'whole-program': tuple(functions),
+            },
+            'callgraph': tuple(callgraph),
+        }
+        with open(self.path, 'wb') as fo:
+            fo.write(marshal.dumps(data))
+
+
+encoder = CaptureEncoder()
+gimple_capture = GimpleCapture(encoder, name='gimple-capture')
+gimple_capture.register_after('cfg')
+program_capture = ProgramCapture(encoder, gimple_capture, name='program-capture')
+program_capture.register_after('whole-program')
@@ -0,0 +1,21 @@
+# Format of files written by capture.py and read by offline/gcc.py. A file
+# is a marshalled dict: table of trees, each one a record of its class name,
+# text and captured attributes, classes with names of their bases, GIMPLE of
+# functions captured after each pass and the callgraph.
+CAPTURE_VERSION = 1
+
+# kinds of encoded values
+VALUE_PLAIN = 0
+VALUE_TREE = 1
+VALUE_CLASS = 2
+VALUE_LIST = 3
+VALUE_LOCATION = 4
+
+# attributes of trees and statements used by the analyses, other ones are
+# not captured
+ATTRIBUTES = (
+    'name', 'type', 'operand', 'var', 'version', 'constant', 'arguments',
+    'target', 'field', 'array', 'index', 'offset',
+    'lhs', 'rhs', 'exprcode', 'fndecl', 'fn', 'args', 'retval', 'labl',
+    'true_label', 'false_label', 'loc',
+)
@@ -0,0 +1,176 @@
+# Dominator and post-dominator trees of control flow graphs, computed by
+# the Lengauer-Tarjan algorithm in O(m log n) and cached per function, so
+# that every pass asking for a tree of a function computes it once. Trees
+# are built on the first request, passes which never ask for one of them
+# do not pay for it.
+
+
+def immediate_dominators(root, successors):
+    # Returns dict of immediate dominators of nodes reachable from root,
+    # root is mapped to None
+    number, vertex, parent = {}, [], []
+    stack = [(root, -1)]
+    while stack:
+        node, pushed_by = stack.pop()
+        if node in number:
+            continue
+        number[node] = len(vertex)
+        vertex.append(node)
+        parent.append(pushed_by)
+        for succ in reversed(successors(node)):
+            if succ not in number:
+                stack.append((succ, number[node]))
+
+    count = len(vertex)
+    preds = [[] for _ in range(count)]
+    for v in range(count):
+        for succ in successors(vertex[v]):
+            preds[number[succ]].append(v)
+
+    semi = list(range(count))
+    label = list(range(count))
+    ancestor = [-1] * count
+    idom = [0] * count
+    bucket = [[] for _ in range(count)]
+
+    def evaluate(v):
+        # Returns node of minimal semidominator on the forest path to v,
+        # compressing the path on the way
+        if ancestor[v] < 0:
+            return v
+        path, u = [], v
+        while ancestor[ancestor[u]] >= 0:
+            path.append(u)
+            u = ancestor[u]
+        for u in reversed(path):
+            a = ancestor[u]
+            if semi[label[a]] < semi[label[u]]:
+                label[u] = label[a]
+            ancestor[u] = ancestor[a]
+        return label[v]
+
+    for w in range(count - 1, 0, -1):
+        for v in preds[w]:
+            u = evaluate(v)
+            if semi[u] < semi[w]:
+                semi[w] = semi[u]
+        bucket[semi[w]].append(w)
+        p = parent[w]
+        ancestor[w] = p
+        for v in bucket[p]:
+            u = evaluate(v)
+            idom[v] = u if semi[u] < semi[v] else p
+        bucket[p] = []
+
+    for w in range(1, count):
+        if idom[w] != semi[w]:
+            idom[w] = idom[idom[w]]
+
+    result = {root: None}
+    for w in range(1, count):
+        result[vertex[w]] = vertex[idom[w]]
+    return result
+
+
+class DominatorTree(object):
+    # Tree of immediate dominators of nodes reachable from root. Nodes are
+    # numbered in preorder of the tree, so dominance is a test of intervals.
+
+    def __init__(self, root, successors):
+        self.root = root
+        self.idom = immediate_dominators(root, successors)
+        self.children = dict((node, []) for node in self.idom)
+        for node, idom in self.idom.items():
+            if idom is not None:
+                self.children[idom].append(node)
+        for children in self.children.values():
+            children.sort()
+
+        self.enter, self.leave = {}, {}
+        clock = 0
+        stack = [(root, iter(self.children[root]))]
+        self.enter[root] = clock
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            clock += 1
+            if child is None:
+                self.leave[node] = clock
+                stack.pop()
+            else:
+                self.enter[child] = clock
+                stack.append((child, iter(self.children[child])))
+
+    def __contains__(self, node):
+        return node in self.idom
+
+    def dominates(self, a, b):
+        # Returns True if every path from root to b passes through a
+        return self.enter[a] <= self.enter[b] and self.leave[b] <= self.leave[a]
+
+    def dominators(self, node):
+        # Returns node and its dominators up to root
+        chain = []
+        while node is not None:
+            chain.append(node)
+            node = self.idom[node]
+        return chain
+
+
+def block_graph(cfg):
+    # Returns successors and predecessors of blocks by their indices
+    succs, preds = {}, {}
+    for block in cfg.basic_blocks:
+        succs[block.index] = [edge.dest.index for edge in block.succs]
+        preds.setdefault(block.index, [])
+        for dest in succs[block.index]:
+            preds.setdefault(dest, []).append(block.index)
+    return succs, preds
+
+
+class FunctionTrees(object):
+    # Dominator and post-dominator trees of blocks of a function, each one
+    # is built when it is requested first
+
+    def __init__(self, fun, succs, preds):
+        self.entry = fun.cfg.entry.index
+        self.exit = fun.cfg.exit.index
+        self.succs = succs
+        self.preds = preds
+        self.dominators = None
+        self.post_dominators = None
+
+    def dominator_tree(self):
+        if self.dominators is None:
+            self.dominators = DominatorTree(self.entry, self.succs.__getitem__)
+        return self.dominators
+
+    def post_dominator_tree(self):
+        if self.post_dominators is None:
+            self.post_dominators = DominatorTree(self.exit, self.preds.__getitem__)
+        return self.post_dominators
+
+
+# trees of functions by name with the edges of cfg they were built for
+_trees = {}
+
+
+def function_trees(fun):
+    # Returns trees of the function, built again only if its cfg changed
+    succs, preds = block_graph(fun.cfg)
+    edges = sorted(succs.items())
+    cached = _trees.get(fun.decl.name)
+    if cached is not None and cached[0] == edges:
+        return cached[1]
+
+    trees = FunctionTrees(fun, succs, preds)
+    _trees[fun.decl.name] = (edges, trees)
+    return trees
+
+
+def dominator_tree(fun):
+    return function_trees(fun).dominator_tree()
+
+
+def post_dominator_tree(fun):
+    return function_trees(fun).post_dominator_tree()
@@ -0,0 +1,188 @@
+# Lowering of GIMPLE blocks into the code RaceFinder interprets. A block
+# is lowered once into a tuple of operations, each one is a tuple of its
+# opcode and operands decoded from the gcc objects: Locations of variables
+# resolved in the function, interned addresses of lock variables and
+# file and line of accesses. Accesses to locations that are never
+# recorded are dropped while lowering.
+import gcc
+
+from summaries import GuardedAccess, Address
+
+# raise the exception found while lowering: (OP_ERROR, exception)
+OP_ERROR = 0
+# record access: (OP_ACCESS, location, kind, file, line)
+OP_ACCESS = 1
+# record accesses through pointer: (OP_DEREF, name, location, kind, file, line)
+OP_DEREF = 2
+# p = q: (OP_ASSIGN, p, q)
+OP_ASSIGN = 3
+# p = &q: (OP_ADDRESS, p, Address(q))
+OP_ADDRESS = 4
+# p = *q: (OP_LOAD, p, q)
+OP_LOAD = 5
+# *p = q: (OP_STORE, p, q)
+OP_STORE = 6
+# *p = &q: (OP_STORE_ADDRESS, p, Address(q))
+OP_STORE_ADDRESS = 7
+# *p = *q: (OP_STORE_LOAD, p, q)
+OP_STORE_LOAD = 8
+# pthread_mutex_lock(&m) or pthread_mutex_lock(p):
+# (OP_LOCK, p, Address(m)), the unused operand is None
+OP_LOCK = 9
+OP_UNLOCK = 10
+# call of function: (OP_CALL, name, operands of arguments)
+OP_CALL = 11
+# pthread_create: (OP_SPAWN, name of function, operand of argument, file, line)
+OP_SPAWN = 12
+
+# operand of an argument is (is address, location of variable) or None if
+# the argument is not a variable, see RaceFinder.argument_shape
+
+COMPARISONS = (gcc.EqExpr, gcc.NeExpr, gcc.LeExpr, gcc.LtExpr, gcc.GeExpr, gcc.GtExpr)
+
+
+def variable_name(value):
+    # ssa names are their variables
+    return str(value.var) if isinstance(value, gcc.SsaName) else str(value)
+
+
+class BlockLowering(object):
+    # Lowers statements of blocks of a function, locations are locations of
+    # its variables by name. Assignments to resolved pointers are dropped,
+    # their values are known in every state.
+
+    def __init__(self, locations, resolved=()):
+        self.locations = locations
+        self.resolved = resolved
+        self.code = []
+
+    def lower(self, block):
+        # Returns number of statements and operations of the block. Errors
+        # are raised when the statement is interpreted, as if it was not
+        # lowered.
+        self.code = []
+        for stat in block.gimple:
+            try:
+                self.lower_statement(stat)
+            except Exception as error:
+                self.code.append((OP_ERROR, error))
+                break
+        return len(block.gimple), tuple(self.code)
+
+    def lower_statement(self, stat):
+        if isinstance(stat, gcc.GimpleAssign):
+            self.lower_value(stat.lhs, stat, GuardedAccess.WRITE)
+            for rhs in stat.rhs:
+                self.lower_value(rhs, stat, GuardedAccess.READ)
+
+        elif isinstance(stat, gcc.GimpleCall):
+            if stat.lhs:
+                self.lower_value(stat.lhs, stat, GuardedAccess.WRITE)
+            for rhs in stat.args:
+                self.lower_value(rhs, stat, GuardedAccess.READ)
+
+        elif isinstance(stat, gcc.GimpleReturn):
+            if stat.retval:
+                self.lower_value(stat.retval, stat, GuardedAccess.READ)
+
+        elif isinstance(stat, gcc.GimpleLabel):
+            pass
+
+        elif isinstance(stat, gcc.GimpleCond) and stat.exprcode in COMPARISONS:
+            self.lower_value(stat.lhs, stat, GuardedAccess.READ)
+            self.lower_value(stat.rhs, stat, GuardedAccess.READ)
+
+        else:
+            raise Exception('Unhandled statement: {}'.format(repr(stat)))
+
+        if isinstance(stat, gcc.GimpleAssign) and len(stat.rhs) == 1:
+            self.lower_aliases(stat.lhs, stat.rhs[0])
+
+        if isinstance(stat, gcc.GimpleCall):
+            self.lower_call(stat)
+
+    def position(self, stat):
+        loc = stat.loc
+        return (loc.file, loc.line) if loc else (None, None)
+
+    def lower_value(self, value, stat, kind):
+        if isinstance(value, gcc.SsaName):
+            self.lower_value(value.var, stat, kind)
+
+        elif isinstance(value, (gcc.VarDecl, gcc.ParmDecl)):
+            # p
+            location = self.locations[str(value)]
+            if location.is_global():
+                self.code.append((OP_ACCESS, location, kind) + self.position(stat))
+
+        elif isinstance(value, gcc.MemRef):
+            # *p
+            name = variable_name(value.operand)
+            location = self.locations[name]
+            if location.is_shared():
+                self.code.append((OP_ACCESS, location, GuardedAccess.READ) + self.position(stat))
+            self.code.append((OP_DEREF, name, location, kind) + self.position(stat))
+
+        elif value is None or isinstance(value, (gcc.IntegerCst, gcc.AddrExpr, gcc.Constructor)):
+            pass
+
+        else:
+            raise Exception('Unexpected value: {}'.format(repr(value)))
+
+    def lower_aliases(self, lhs, rhs):
+        if isinstance(lhs, gcc.MemRef):
+            p = self.locations[variable_name(lhs.operand)]
+            if isinstance(rhs, gcc.AddrExpr):
+                self.code.append((OP_STORE_ADDRESS, p, Address(self.locations[variable_name(rhs.operand)])))
+            elif isinstance(rhs, gcc.MemRef):
+                self.code.append((OP_STORE_LOAD, p, self.locations[variable_name(rhs.operand)]))
+            elif isinstance(rhs, (gcc.VarDecl, gcc.ParmDecl, gcc.SsaName)):
+                self.code.append((OP_STORE, p, self.locations[variable_name(rhs)]))
+            elif not isinstance(rhs, (gcc.IntegerCst, gcc.Constructor)):
+                raise Exception("Unexpected rhs: {}".format(repr(rhs)))
+
+        elif isinstance(lhs, (gcc.VarDecl, gcc.ParmDecl, gcc.SsaName)):
+            if variable_name(lhs) in self.resolved:
+                return
+            p = self.locations[variable_name(lhs)]
+            if isinstance(rhs, gcc.AddrExpr):
+                self.code.append((OP_ADDRESS, p, Address(self.locations[variable_name(rhs.operand)])))
+            elif isinstance(rhs, gcc.MemRef):
+                self.code.append((OP_LOAD, p, self.locations[variable_name(rhs.operand)]))
+            elif isinstance(rhs, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+                self.code.append((OP_ASSIGN, p, self.locations[variable_name(rhs)]))
+            elif not isinstance(rhs, (gcc.IntegerCst, gcc.Constructor)):
+                raise Exception("Unexpected rhs: {}".format(repr(rhs)))
+
+        else:
+            raise Exception("Unexpected lhs: {}".format(repr(lhs)))
+
+    def operand(self, arg):
+        is_address = isinstance(arg, gcc.AddrExpr)
+        if is_address:
+            arg = arg.operand
+
+        if not isinstance(arg, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+            return None
+
+        return is_address, self.locations[variable_name(arg)]
+
+    def lower_call(self, stat):
+        fname = str(stat.fndecl)
+        if fname in ('pthread_mutex_lock', 'pthread_mutex_unlock'):
+            opcode = OP_LOCK if fname == 'pthread_mutex_lock' else OP_UNLOCK
+            arg = stat.args[0]
+            if isinstance(arg, gcc.AddrExpr):
+                lock = Address(self.locations[variable_name(arg.operand)])
+                self.code.append((opcode, None, lock))
+            elif isinstance(arg, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
+                self.code.append((opcode, self.locations[variable_name(arg)], None))
+            else:
+                raise Exception('Unexpexted argument of {}'.format(fname))
+
+        elif fname == 'pthread_create':
+            self.code.append((OP_SPAWN, str(stat.args[2].operand),
+                              self.operand(stat.args[3])) + self.position(stat))
+
+        else:
+            self.code.append((OP_CALL, fname, tuple(self.operand(arg) for arg in stat.args)))
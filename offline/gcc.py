@@ -0,0 +1,348 @@
+# Replay of a program captured by capture.py. Implements the subset of the
+# gcc module API used by the analyses over the capture file, so that they
+# run without the compiler, see replay.py.
+import marshal
+
+from capture_format import (
+    CAPTURE_VERSION, VALUE_PLAIN, VALUE_TREE, VALUE_CLASS, VALUE_LIST, VALUE_LOCATION,
+)
+
+argument_dict = {}
+
+# registered passes and names of passes they run after
+_passes = []
+_variables = []
+_nodes = []
+# functions captured after each pass
+_functions = {}
+
+# passes whose GIMPLE is captured, in the order gcc runs them
+STAGES = ('cfg', 'whole-program')
+
+
+class Location(object):
+
+    def __init__(self, file, line, column=None):
+        self.file = file
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return '{}:{}:{}'.format(self.file, self.line, self.column)
+
+
+class Tree(object):
+    # Attributes of replayed trees are restored from the capture, str
+    # returns the text gcc printed for the tree
+
+    def __str__(self):
+        return self._text
+
+    def __repr__(self):
+        return 'gcc.{}({!r})'.format(type(self).__name__, self._text)
+
+
+class Declaration(Tree):
+    pass
+
+
+class VarDecl(Declaration):
+    pass
+
+
+class ParmDecl(Declaration):
+    pass
+
+
+class FunctionDecl(Declaration):
+    # function with body, None for declarations of external functions
+    function = None
+
+
+class Type(Tree):
+    pass
+
+
+class PointerType(Type):
+    pass
+
+
+class IntegerType(Type):
+    pass
+
+
+class Constant(Tree):
+    pass
+
+
+class IntegerCst(Constant):
+    pass
+
+
+class Constructor(Tree):
+    pass
+
+
+class SsaName(Tree):
+    pass
+
+
+class Reference(Tree):
+    pass
+
+
+class MemRef(Reference):
+    pass
+
+
+class Unary(Tree):
+    pass
+
+
+class AddrExpr(Unary):
+    pass
+
+
+class Binary(Tree):
+    pass
+
+
+class Comparison(Binary):
+    pass
+
+
+class EqExpr(Comparison):
+    pass
+
+
+class NeExpr(Comparison):
+    pass
+
+
+class LtExpr(Comparison):
+    pass
+
+
+class LeExpr(Comparison):
+    pass
+
+
+class GtExpr(Comparison):
+    pass
+
+
+class GeExpr(Comparison):
+    pass
+
+
+class Gimple(Tree):
+    loc = None
+
+
+class GimpleAssign(Gimple):
+    pass
+
+
+class GimpleCall(Gimple):
+    pass
+
+
+class GimpleCond(Gimple):
+    pass
+
+
+class GimpleLabel(Gimple):
+    pass
+
+
+class GimpleReturn(Gimple):
+    pass
+
+
+class Edge(object):
+
+    def __init__(self, src, dest):
+        self.src = src
+        self.dest = dest
+
+
+class BasicBlock(object):
+
+    def __init__(self, index, gimple):
+        self.index = index
+        self.gimple = gimple
+        self.phi_nodes = []
+        self.succs = []
+        self.preds = []
+
+    def __repr__(self):
+        return 'gcc.BasicBlock(index={})'.format(self.index)
+
+
+class Cfg(object):
+
+    def __init__(self, basic_blocks, entry, exit):
+        self.basic_blocks = basic_blocks
+        self.entry = entry
+        self.exit = exit
+
+
+class Function(object):
+
+    def __init__(self, decl, local_decls, cfg):
+        self.decl = decl
+        self.local_decls = local_decls
+        self.cfg = cfg
+
+    def __repr__(self):
+        return 'gcc.Function({!r})'.format(self.decl.name)
+
+
+class CallgraphEdge(object):
+
+    def __init__(self, caller, callee):
+        self.caller = caller
+        self.callee = callee
+
+
+class CallgraphNode(object):
+
+    def __init__(self, decl):
+        self.decl = decl
+        self.callees = []
+        self.callers = []
+
+
+class Variable(object):
+
+    def __init__(self, decl):
+        self.decl = decl
+
+
+class Pass(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def register_after(self, name, instance_number=0):
+        if name not in STAGES:
+            raise Exception('GIMPLE after {} is not captured'.format(name))
+        _passes.append((self, name))
+
+    def register_before(self, name, instance_number=0):
+        raise Exception('GIMPLE before {} is not captured'.format(name))
+
+
+class GimplePass(Pass):
+    pass
+
+
+class IpaPass(Pass):
+    pass
+
+
+class SimpleIpaPass(IpaPass):
+    pass
+
+
+def get_variables():
+    return list(_variables)
+
+
+def get_callgraph_nodes():
+    return list(_nodes)
+
+
+class CaptureDecoder(object):
+    # Rebuilds trees of the capture lazily, so that cyclic references of
+    # trees are restored
+
+    def __init__(self, data):
+        self.classes = data['classes']
+        self.records = data['trees']
+        self.trees = [None] * len(self.records)
+
+    def decode_class(self, name):
+        cls = globals().get(name)
+        if cls is None:
+            bases = tuple(self.decode_class(base) for base in self.classes.get(name, ()))
+            cls = type(name, bases or (Tree,), {})
+            globals()[name] = cls
+        return cls
+
+    def decode(self, value):
+        kind = value[0]
+        if kind == VALUE_TREE:
+            return self.decode_tree(value[1])
+        if kind == VALUE_CLASS:
+            return self.decode_class(value[1])
+        if kind == VALUE_LIST:
+            return [self.decode(item) for item in value[1]]
+        if kind == VALUE_LOCATION:
+            return Location(*value[1:])
+        return value[1]
+
+    def decode_tree(self, index):
+        tree = self.trees[index]
+        if tree is None:
+            name, text, attributes = self.records[index]
+            tree = self.trees[index] = object.__new__(self.decode_class(name))
+            tree._text = text
+            for attribute, value in attributes:
+                setattr(tree, attribute, self.decode(value))
+        return tree
+
+    def decode_function(self, record):
+        decl, local_decls, blocks, entry, exit = record
+        basic_blocks = dict(
+            (index, BasicBlock(index, [self.decode_tree(stat) for stat in gimple]))
+            for index, gimple, succs in blocks)
+        for index, gimple, succs in blocks:
+            for dest in succs:
+                edge = Edge(basic_blocks[index], basic_blocks[dest])
+                basic_blocks[index].succs.append(edge)
+                basic_blocks[dest].preds.append(edge)
+
+        decl = self.decode_tree(decl)
+        cfg = Cfg([basic_blocks[index] for index, gimple, succs in blocks],
+                  basic_blocks[entry], basic_blocks[exit])
+        decl.function = Function(decl, [self.decode_tree(local) for local in local_decls], cfg)
+        return decl.function
+
+
+def load(path):
+    # Replaces the replayed program by the captured one
+    with open(path, 'rb') as fi:
+        data = marshal.loads(fi.read())
+    if data.get('version') != CAPTURE_VERSION:
+        raise Exception('Unsupported capture version: {}'.format(data.get('version')))
+
+    decoder = CaptureDecoder(data)
+    for stage in STAGES:
+        _functions[stage] = [decoder.decode_function(record)
+                             for record in data['passes'].get(stage, ())]
+
+    del _nodes[:]
+    for decl, function, callees in data['callgraph']:
+        _nodes.append(CallgraphNode(decoder.decode_tree(decl)))
+    for node, (decl, function, callees) in zip(_nodes, data['callgraph']):
+        for callee in callees:
+            edge = CallgraphEdge(node, _nodes[callee])
+            node.callees.append(edge)
+            _nodes[callee].callers.append(edge)
+
+    _variables[:] = [Variable(decoder.decode_tree(decl)) for decl in data['variables']]
+
+
+def run_passes():
+    # Runs registered passes in the order gcc does: function passes over
+    # every function first, then IPA passes over the whole program
+    for stage in STAGES:
+        for pass_, after in _passes:
+            if after != stage:
+                continue
+            if isinstance(pass_, IpaPass):
+                pass_.execute()
+            else:
+                for fun in _functions[stage]:
+                    pass_.execute(fun)
@@ -1,9 +1,36 @@
-from pprint import pprint
-import random
-import copy
+import hashlib
+import heapq
+import itertools
+import os
+import sys
+import time
 
 import gcc
 
+# gcc executes plugin as a script, so make its neighbours importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from alias_oracle import SOLVERS as ALIAS_SOLVERS, AliasOracle
+from callgraph import Callgraph
+from lowering import (
+    BlockLowering, OP_ERROR, OP_ACCESS, OP_DEREF, OP_ASSIGN, OP_ADDRESS, OP_LOAD, OP_STORE,
+    OP_STORE_ADDRESS, OP_STORE_LOAD, OP_LOCK, OP_UNLOCK, OP_CALL, OP_SPAWN,
+)
+from races import find_races
+from results import VERBOSITY_SUMMARIES, open_writer
+from stats import FunctionStats, Statistics
+from summaries import (
+    FORMAT_VERSION, NullLog, UndoLog, RelativeLockset, GuardedAccess, GuardedAccessTable,
+    Type, PointerType, Location, Address, Value, ValueSet, Environment, dump_summaries,
+    RebindingCache, alternatives, join_values,
+)
+from summary_cache import SummaryCache
+
+
+def plugin_argument(name, default=None):
+    # value of -fplugin-arg-python-<name>=<value> if it was passed to gcc
+    return getattr(gcc, 'argument_dict', {}).get(name, default)
+
 
 def count_repetitions(array, value):
     count = 0
@@ -13,322 +40,676 @@ def count_repetitions(array, value):
     return count
 
 
-class RelativeLockset(object):
-    def __init__(self, acquired=None, released=None):
-        self.acquired = acquired or set()
-        self.released = released or set()
-
-    def __hash__(self):
-        acquired = sum([hash(l) for l in self.acquired])
-        released = sum([hash(l) for l in self.released])
-        return acquired + 5 * released
-
-    def __eq__(self, other):
-        return hash(self) == self(other)
-
-    def to_dict(self):
-        return {
-            'acquired': [l.to_dict() for l in self.acquired],
-            'released': [l.to_dict() for l in self.released],
-        }
-
-    def acquire(self, lock):
-        if lock in self.released:
-            self.released.remove(lock)
-        self.acquired.add(lock)
-
-    def release(self, lock):
-        if lock in self.acquired:
-            self.acquired.remove(lock)
-        else:
-            self.released.add(lock)
-
-    def update(self, lockset):
-        self.acquired = self.acquired.intersection(lockset.acquired)
-        self.released = self.released.union(lockset.released)
-
-
-class GuardedAccess(object):
-    READ = 'read'
-    WRITE = 'write'
+class BudgetExceeded(Exception):
+    pass
 
-    def __init__(self, access, lockset, kind, file=None, line=None):
-        self.access = access
-        self.lockset = lockset
-        self.kind = kind
-        self.file = file
-        self.line = line
-
-    def __hash__(self):
-        access = hash(self.access)
-        lockset = hash(self.lockset)
-        kind = hash(self.kind)
-        return access + 2 * lockset + 3 * kind + hash(self.line) + hash(self.file)
-
-    def __eq__(self, other):
-        return hash(self) == hash(other)
-
-    def to_dict(self):
-        return {
-            'access': self.access.to_dict(),
-            'lockset': self.lockset.to_dict(),
-            'kind': self.kind,
-            'file': self.file,
-            'line': self.line,
-        }
 
+class PathBudget(object):
+    # Bounds of the path-sensitive analysis of a function, BudgetExceeded
+    # is raised when any of them is exceeded. None is no bound.
+    # steps between reads of the clock
+    CLOCK_INTERVAL = 256
 
-class GuardedAccessTable(object):
-    def __init__(self, accesses=None):
-        self.accesses = accesses or set()
+    def __init__(self, max_paths=None, max_statements=None, max_time=None):
+        self.max_paths = max_paths
+        self.max_statements = max_statements
+        self.deadline = time.time() + max_time if max_time is not None else None
+        self.paths = 0
+        self.statements = 0
+        self.steps = 0
 
-    def to_dict(self):
-        return [ga.to_dict() for ga in self.accesses]
+    def path(self):
+        self.paths += 1
+        if self.max_paths is not None and self.paths > self.max_paths:
+            raise BudgetExceeded('paths')
+        self.step()
 
-    def add(self, access):
-        if access not in self.accesses:
-            self.accesses.add(access)
+    def statement(self, count=1):
+        self.statements += count
+        if self.max_statements is not None and self.statements > self.max_statements:
+            raise BudgetExceeded('statements')
+        self.step()
 
-    def update(self, table):
-        self.accesses.update(table.accesses)
+    def step(self):
+        self.steps += 1
+        if (self.deadline is not None and self.steps % self.CLOCK_INTERVAL == 0 and
+                time.time() > self.deadline):
+            raise BudgetExceeded('time')
 
 
-class Type(object):
-    def __init__(self, name):
-        self.name = name
-
-    def __hash__(self):
-        return hash(self.name)
-
-    def __eq__(self, other):
-        return hash(self) == hash(other)
-
-    def to_dict(self):
-        return {
-            'name': self.name,
-        }
-
-
-class PointerType(Type):
-    def __init__(self, type):
-        super(PointerType, self).__init__(name='pointer')
-        self.type = type
-
-    def __hash__(self):
-        return hash(self.name) + 3 * hash(self.type)
-
-    def to_dict(self):
-        return {
-            'name': self.name,
-            'type': self.type.to_dict(),
-        }
-
-
-class Location(object):
-    VISIBILITY_GLOBAL = 'global'
-    VISIBILITY_LOCAL = 'local'
-    VISIBILITY_FORMAL = 'formal'
-
-    STATUS_COMMON = 'common'
-    STATUS_FAKE = 'fake'
-
-    def __init__(self, name, type, visibility, status, value=None):
-        self.name = name
-        self.type = type
-        self.visibility = visibility
-        self.status = status
-        self.value = value
-
-    def __hash__(self):
-        return (hash(self.name) + 2 * hash(self.type) + 3 * hash(self.visibility) +
-                4 * hash(self.status))
-
-    def __eq__(self, other):
-        return hash(self) == hash(other)
-
-    def to_dict(self, with_value=True):
-        res = {
-            'name': self.name,
-            'type': self.type.to_dict(),
-            'visibility': self.visibility,
-            'status': self.status,
-        }
-        if with_value:
-            res['value'] = self.value.to_dict() if self.value else None
-        return res
-
-    def is_shared(self):
-        return self.visibility in (self.VISIBILITY_GLOBAL, self.VISIBILITY_FORMAL)
-
-    def is_global(self):
-        return self.visibility == self.VISIBILITY_GLOBAL
-
-    def is_formal(self):
-        return self.visibility == self.VISIBILITY_FORMAL
-
-    def is_fake(self):
-        return self.status == self.STATUS_FAKE
-
-
-class Address(object):
-    def __init__(self, location):
-        self.location = location
-
-    def __hash__(self):
-        return hash(self.location)
-
-    def __eq__(self, other):
-        return hash(self) == hash(other)
-
-    def to_dict(self):
-        return {
-            'address_of': self.location.to_dict()
-        }
-
-
-class Value(object):
-    ID_RANGE = (0, 10000)
-
-    def __init__(self):
-        self.id = random.randint(*self.ID_RANGE)
-
-    def __hash__(self):
-        return hash(self.id)
-
-    def __eq__(self, other):
-        return hash(self) == hash(other)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-        }
+def optional(value, convert):
+    return convert(value) if value is not None else None
 
 
 class RaceFinder(gcc.IpaPass):
-    FAKE_RANGE = (0, 10000)
     MAX_LEVEL = 4
+    # bound of iterations over summaries of mutually recursive functions
+    MAX_RECURSION_ITERATIONS = 10
+    # bound of tabulated block transfers of the analyzed function
+    MAX_TRANSFERS = 4096
+    # default bound of the summary cache size in bytes
+    CACHE_SIZE = 64 * 1024 * 1024
+
+    # enumerate every entry-to-exit path and merge their results
+    MODE_PATH = 'path'
+    # the same as MODE_PATH, but pathes are generated one by one
+    MODE_STREAM = 'stream'
+    # walk pathes depth-first, sharing the state computed for their prefixes
+    MODE_DFS = 'dfs'
+    # iterate block states to a fixed point, joining them at merge points
+    MODE_DATAFLOW = 'dataflow'
+    MODES = (MODE_PATH, MODE_STREAM, MODE_DFS, MODE_DATAFLOW)
+
+    # pointers are followed by assignments on every analyzed path, other
+    # values of race-aliases name the solver of the whole-program oracle
+    ALIASES_PATHS = 'paths'
 
     def __init__(self, *args, **kwargs):
         super(RaceFinder, self).__init__(*args, **kwargs)
         self.summaries = {}
-        self.global_variables = {}
+        self.global_variables = Environment()
+        self.function_variables = {}
         self.entries = []
+        self.callgraph = None
+        # callgraph component of each function and their cache keys
+        self.components = {}
+        self.component_keys = {}
+        self.component_references = {}
+
+        # changes of the analysis state are applied through the log and
+        # thread entries found on the current path are added to spawned,
+        # both are replaced while a function is analyzed in MODE_DFS
+        self.log = NullLog()
+        self.spawned = self.entries
+        # calls of functions without bodies made by the analyzed function
+        self.calls = set()
+        # name of the analyzed function
+        self.function = None
+        # names of functions in the order their first summary was computed
+        self.analyzed = []
+        # transfers of blocks of the analyzed function by their input state
+        self.transfers = {}
+        # code of blocks by function name and block index
+        self.lowered = {}
+        # interpreters of the code by opcode
+        self.operations = {
+            OP_ERROR: self.run_error,
+            OP_ACCESS: self.run_access,
+            OP_DEREF: self.run_deref,
+            OP_ASSIGN: self.run_assign,
+            OP_ADDRESS: self.run_address,
+            OP_LOAD: self.run_load,
+            OP_STORE: self.run_store,
+            OP_STORE_ADDRESS: self.run_store_address,
+            OP_STORE_LOAD: self.run_store_load,
+            OP_LOCK: self.run_lock,
+            OP_UNLOCK: self.run_unlock,
+            OP_CALL: self.run_call,
+            OP_SPAWN: self.run_spawn,
+        }
+        # callee summaries rebound to shapes of call site arguments
+        self.rebindings = RebindingCache()
+
+        self.mode = plugin_argument('race-mode', self.MODE_PATH)
+        if self.mode not in self.MODES:
+            raise Exception('Unknown race-mode: {}'.format(self.mode))
+
+        # a function exceeding the bounds of paths, statements or seconds of
+        # its analysis is analyzed again in MODE_DATAFLOW
+        self.max_paths = optional(plugin_argument('race-max-paths'), int)
+        self.max_statements = optional(plugin_argument('race-max-statements'), int)
+        self.max_time = optional(plugin_argument('race-max-time'), float)
+        self.budget = PathBudget()
+        # reasons of widening by names of widened functions
+        self.widened = {}
+
+        # points-to sets of the whole program are computed once and queried
+        # for pointers of memory accesses and locks instead
+        self.alias_mode = plugin_argument('race-aliases', self.ALIASES_PATHS)
+        if self.alias_mode != self.ALIASES_PATHS and self.alias_mode not in ALIAS_SOLVERS:
+            raise Exception('Unknown race-aliases: {}'.format(self.alias_mode))
+        self.oracle = None
+        # shared locations of pointers answered by the oracle
+        self.oracle_locations = {}
+        # names of pointers the oracle resolves by function name
+        self.resolved = {}
+
+        # summaries are reused between compilations if cache is enabled
+        self.cache = None
+        cache_dir = plugin_argument('race-cache-dir')
+        if cache_dir:
+            cache_size = int(plugin_argument('race-cache-size', self.CACHE_SIZE))
+            self.cache = SummaryCache(cache_dir, cache_size)
+
+        # summaries of the translation unit are written to the file and
+        # races are found by race_linker.py over all units of the program
+        self.summary_file = plugin_argument('race-summary-file')
+
+        # number of processes comparing pairs of thread entries
+        self.jobs = int(plugin_argument('race-jobs', 1))
+
+        # summaries and races are written in the format to the file
+        self.results_format = plugin_argument('race-format', 'text')
+        self.results_file = plugin_argument('race-output')
+        self.verbosity = int(plugin_argument('race-verbosity', VERBOSITY_SUMMARIES))
+        self.results = None
+
+        # counters of analyzed functions and timings of analysis phases are
+        # written to the file as JSON
+        self.stats = Statistics()
+        self.stats_file = plugin_argument('race-stats')
+        self.function_stats = FunctionStats()
 
     def execute(self, *args, **kwargs):
-        self.global_variables = self.init_global_variables()
+        self.results = open_writer(self.results_format, self.results_file, self.verbosity)
+        try:
+            self.analyze_program()
+        finally:
+            self.results.close()
+
+    def analyze_program(self):
+        with self.stats.phase('globals'):
+            self.global_variables = self.init_global_variables()
+            self.callgraph = Callgraph(gcc.get_callgraph_nodes())
+
+            components = self.callgraph.bottom_up()
+            for component in components:
+                for name in component:
+                    self.components[name] = component
+
+        if self.alias_mode != self.ALIASES_PATHS:
+            with self.stats.phase('aliases'):
+                # functions of a unit may be called from other units
+                self.oracle = AliasOracle(self.alias_mode, external=bool(self.summary_file))
+                self.oracle.build(gcc.get_callgraph_nodes(), gcc.get_variables())
+
+        # calculate summaries for functions, callees before callers
+        with self.stats.phase('summaries'):
+            for component in components:
+                self.compute_component(component)
+
+        if self.summary_file:
+            with self.stats.phase('write_summaries'):
+                self.write_summaries(self.summary_file)
+        else:
+            # find thread entry points and concretize summaries
+            with self.stats.phase('find_races'):
+                self.find_races()
+
+        self.results.message('Rebinding cache: {} hits, {} misses'.format(
+            self.rebindings.hits, self.rebindings.misses))
+
+        if self.widened:
+            self.results.message('Widened to dataflow: {}'.format(', '.join(
+                '{} ({})'.format(name, self.widened[name]) for name in sorted(self.widened))))
+
+        if self.cache is not None:
+            self.cache.evict()
+            self.results.message('Summary cache: {} hits, {} misses'.format(
+                self.cache.hits, self.cache.misses))
+
+        if self.stats_file:
+            self.stats.write(self.stats_file)
+
+    def compute_component(self, component):
+        if all(name in self.summaries for name in component):
+            return
+
+        if self.cache is None:
+            self.analyze_callgraph_component(component)
+            return
+
+        key = self.component_key(component)
+
+        # thread functions are not reached by callgraph edges, analyze them
+        # first so that entries created by component are the only new ones
+        self.summaries.update((name, None) for name in component)
+        for name in self.component_references[component[0]]:
+            if name in self.components and name not in self.summaries:
+                self.compute_component(self.components[name])
+        for name in component:
+            del self.summaries[name]
+
+        cached = self.cache.load(key)
+        if cached is not None:
+            summaries, entries = cached
+            self.summaries.update(summaries)
+            for name, summary in summaries:
+                self.results.function(name)
+                self.results.summary(name, summary['lockset'], summary['accesses'])
+                self.stats.function(name).cached = 1
+                if summary['widened'] is not None:
+                    self.widened[name] = summary['widened']
+                    self.stats.function(name).widened = 1
+            self.entries.extend(entries)
+            return
+
+        entries_count = len(self.entries)
+        self.analyze_callgraph_component(component)
+        self.cache.store(key, [(name, self.summaries[name]) for name in component],
+                         self.entries[entries_count:])
+
+    def analyze_callgraph_component(self, component):
+        if self.callgraph.is_recursive(component):
+            self.analyze_component(component)
+        else:
+            self.analyze_node(self.callgraph.get(component[0]))
+
+    def component_key(self, component):
+        # Key of component summaries is a hash of GIMPLE of its functions,
+        # analysis settings and keys of all functions they refer to
+        key = self.component_keys.get(component[0])
+        if key is not None:
+            return key
+
+        # mark component, so that reference cycles through thread entries end
+        for name in component:
+            self.component_keys[name] = ''
+
+        digest = hashlib.sha1()
+        digest.update('{} {} {} {} {} {} {} {} {}'.format(
+            FORMAT_VERSION, self.mode, self.MAX_LEVEL, self.MAX_RECURSION_ITERATIONS,
+            bool(self.summary_file), self.alias_mode,
+            self.max_paths, self.max_statements, self.max_time))
+        for variable in gcc.get_variables():
+            digest.update('{} {};'.format(variable.decl.name, variable.decl.type))
+
+        references = set()
+        for name in sorted(component):
+            self.hash_function(self.callgraph.get(name).decl.function, digest, references)
+            if self.oracle is not None:
+                # pointers of the function depend on the whole program
+                digest.update(self.oracle.describe(name))
+        references.difference_update(component)
+
+        for name in sorted(references):
+            if name in self.components:
+                digest.update('{}={};'.format(name, self.component_key(self.components[name])))
+            else:
+                digest.update('{};'.format(name))
+
+        key = digest.hexdigest()
+        for name in component:
+            self.component_keys[name] = key
+        self.component_references[component[0]] = references
+        return key
+
+    def hash_function(self, fun, digest, references):
+        # Updates digest with GIMPLE of function, adds names of functions
+        # called from it or started in threads to references
+        digest.update('function {}('.format(fun.decl.name))
+        for decl in fun.decl.arguments:
+            digest.update('{} {},'.format(decl.type, decl))
+        digest.update(')')
+        for decl in fun.local_decls:
+            digest.update('{} {};'.format(decl.type, decl))
 
-        # calculate summaries for functions
-        for node in gcc.get_callgraph_nodes():
-            if not self.is_analyzed(node):
-                self.analyze_node(node)
+        for block in fun.cfg.basic_blocks:
+            digest.update('bb {} -> {}:'.format(
+                block.index, [edge.dest.index for edge in block.succs]))
+            for stat in block.gimple:
+                loc = stat.loc
+                digest.update('{} @{}:{};'.format(
+                    stat, loc.file if loc else None, loc.line if loc else None))
 
-        # find thread entry points and concretize summaries
-        self.find_races()
+                if isinstance(stat, gcc.GimpleCall):
+                    fname = str(stat.fndecl)
+                    references.add(fname)
+                    if fname == 'pthread_create':
+                        references.add(str(stat.args[2].operand))
 
     def init_global_variables(self):
-        global_variables = {}
+        global_variables = Environment()
         for variable in gcc.get_variables():
             name, type = variable.decl.name, variable.decl.type
-            global_variables[name] = self.init_variable(
-                name, type, visibility=Location.VISIBILITY_GLOBAL)
+            global_variables.locations[name] = self.init_variable(
+                global_variables, name, type, visibility=Location.VISIBILITY_GLOBAL)
         return global_variables
 
-    def init_variable(self, name, type, visibility=None, status=None):
+    def init_variable(self, variables, name, type, visibility=None, status=None, pointer=None, level=0):
+        # Creates location of variable and stores its initial value in
+        # variables environment. Fake locations pointed to by the pointer
+        # are named by it and their level, so that summaries cached or
+        # computed in other units refer to the same locations.
         visibility = visibility or Location.VISIBILITY_LOCAL
         status = status or Location.STATUS_COMMON
+        pointer = pointer or name
 
         if isinstance(type, gcc.PointerType):
-            faked_name = '{}_fake_{}'.format(name, random.randint(*self.FAKE_RANGE))
+            faked_name = '{}_fake{}'.format(pointer, level + 1)
             faked_location = self.init_variable(
-               faked_name, type.type, visibility=visibility, status=Location.STATUS_FAKE)
-            return Location(
+               variables, faked_name, type.type, visibility=visibility, status=Location.STATUS_FAKE,
+               pointer=pointer, level=level + 1)
+            location = Location(
                 name=name,
                 visibility=visibility,
                 status=status,
                 type=PointerType(type=faked_location.type),
-                value=Address(faked_location)
             )
-
-        return Location(
-            name=name,
-            type=Type(name=str(type)),
-            visibility=visibility,
-            status=status,
+            value = Address(faked_location)
+        else:
+            location = Location(
+                name=name,
+                type=Type(name=str(type)),
+                visibility=visibility,
+                status=status,
+            )
             value = Value()
-        )
+
+        variables.values = variables.values.set(location, value)
+        return location
 
     def is_analyzed(self, node):
        return node.decl.name in self.summaries
 
     def get_node_by_name(self, name):
         # Returns node if exists, otherwise - None
-        for node in gcc.get_callgraph_nodes():
-            if node.decl.name == name:
-                return node
-        return None
+        return self.callgraph.get(name)
+
+    def analyze_component(self, component):
+        # Functions of the component call each other, so their summaries are
+        # recomputed until none of them changes. Calls inside the component
+        # use summaries of the previous iteration, starting from empty ones.
+        nodes = [self.callgraph.get(name) for name in component]
+        for node in nodes:
+            if not self.is_analyzed(node):
+                self.summaries[node.decl.name] = self.init_summary(node.decl.function)
+
+        spawned = []
+        for iteration in range(self.MAX_RECURSION_ITERATIONS):
+            # only thread entries the component created in the last iteration
+            # are kept, entries of functions first analyzed meanwhile are not
+            # created again
+            if spawned:
+                stale = set(id(entry) for entry in spawned)
+                self.entries[:] = [entry for entry in self.entries if id(entry) not in stale]
+                spawned = []
+
+            previous = [self.summary_state(self.summaries[name]) for name in component]
+            for node in nodes:
+                spawned.extend(self.analyze_node(node))
+
+            if previous == [self.summary_state(self.summaries[name]) for name in component]:
+                break
+
+    def init_summary(self, fun):
+        variables = self.init_variables(fun)
+        return {
+            'lockset': RelativeLockset(),
+            'accesses': GuardedAccessTable(),
+            'formals': self.init_formal_chains(fun, variables),
+            'calls': frozenset(),
+            'widened': None,
+        }
 
-    def analyze_node(self, node):
-        #import ipdb; ipdb.set_trace()
+    def summary_state(self, summary):
+        return summary['lockset'], frozenset(summary['accesses'].accesses)
 
+    def analyze_node(self, node):
+        # Computes summary of the function, returns thread entries it created
         fun = node.decl.function
-        print '==========================================='
-        print 'Analyzed: {}'.format(node.decl.name)
+        self.results.function(node.decl.name)
         #self.print_info(fun)
         #print '------------------------------------------'
 
         variables = self.init_variables(fun)
+        outer_calls, self.calls = self.calls, set()
+        outer_function, self.function = self.function, fun.decl.name
+        stats = self.stats.function(fun.decl.name)
+        outer_stats, self.function_stats = self.function_stats, stats
+        start = time.time()
+
+        outer_budget = self.budget
+        # thread entries of a nested analysis are not results of the block
+        # of the caller which is interpreted meanwhile, so they are added to
+        # entries before the ones of the function
+        outer_log, self.log = self.log, NullLog()
+        spawned = []
+        outer_spawned, self.spawned = self.spawned, spawned
+        outer_transfers, self.transfers = self.transfers, {}
+        entries_count, analyzed_count = len(self.entries), len(self.analyzed)
+        widened = None
+        try:
+            lockset_summary, access_summary = self.analyze_function(fun, variables)
+        except BudgetExceeded as exceeded:
+            # results of the interrupted analysis are dropped, including
+            # summaries of functions first analyzed meanwhile, since their
+            # thread entries are dropped as well. The dataflow analysis joins
+            # the alias states and locksets of all paths, so the widened
+            # summary includes every access of the bounded one, guarded by
+            # the same or fewer locks.
+            del spawned[:]
+            del self.entries[entries_count:]
+            for name in self.analyzed[analyzed_count:]:
+                del self.summaries[name]
+            del self.analyzed[analyzed_count:]
+            self.calls = set()
+            self.transfers = {}
+
+            widened = self.widened[fun.decl.name] = exceeded.args[0]
+            stats.widened = 1
+            self.budget = PathBudget()
+            lockset_summary, access_summary = self.analyze_dataflow(fun, variables)
+        self.budget = outer_budget
+        self.log, self.spawned, self.transfers = outer_log, outer_spawned, outer_transfers
+        if lockset_summary is None:
+            # no path reaches exit
+            lockset_summary, access_summary = RelativeLockset(), GuardedAccessTable()
+
+        stats.analyses += 1
+        stats.time += time.time() - start
+        stats.accesses = len(access_summary.accesses)
+        stats.locks = bin(lockset_summary.acquired | lockset_summary.released).count('1')
+        self.function_stats = outer_stats
+
+        self.results.summary(fun.decl.name, lockset_summary, access_summary)
+
+        if fun.decl.name not in self.summaries:
+            self.analyzed.append(fun.decl.name)
+        self.summaries[fun.decl.name] = {
+            'lockset': lockset_summary,
+            'accesses': access_summary,
+            'formals': self.init_formal_chains(fun, variables),
+            'calls': frozenset(self.calls),
+            'widened': widened,
+        }
+        self.entries.extend(spawned)
+        self.calls = outer_calls
+        self.function = outer_function
+        return spawned
+
+    def analyze_function(self, fun, variables):
+        # Returns lockset and access summaries of the function, the
+        # path-sensitive modes are bounded by the budget
+        if self.mode == self.MODE_DATAFLOW:
+            self.budget = PathBudget()
+            return self.analyze_dataflow(fun, variables)
+
+        self.budget = PathBudget(self.max_paths, self.max_statements, self.max_time)
+        if self.mode == self.MODE_DFS:
+            return self.analyze_dfs(fun, variables)
+        if self.mode == self.MODE_STREAM:
+            return self.analyze_pathes(fun, self.iter_pathes(fun), variables)
+        return self.analyze_pathes(fun, self.build_pathes(fun), variables)
 
+    def print_info(self, fun):
+        print 'Function: {}'.format(fun.decl.name)
+        for bb in fun.cfg.basic_blocks:
+            print 'Basic block: {}'.format(str(bb))
+            for ss in bb.gimple:
+                print 'Instrruction: {}'.format(str(ss))
+                print 'Type: {}'.format(repr(ss))
+
+    def analyze_pathes(self, fun, pathes, variables):
+        # results of each path are merged into summary as soon as it is
+        # analyzed, so pathes may be a generator
         lockset_summary, access_summary = None, None
 
-        pathes = self.build_pathes(fun)
         for path in pathes:
-            lockset, access_table = self.analyze_path(fun, path, copy.deepcopy(variables))
+            self.function_stats.paths += 1
+            self.function_stats.copies += 1
+            lockset, access_table = self.analyze_path(fun, path, variables.fork())
 
             if lockset_summary is None:
                 lockset_summary = lockset
             else:
-                lockset_summary.update(lockset)
+                lockset_summary = lockset_summary.join(lockset)
 
             if access_summary is None:
                 access_summary = access_table
             else:
                 access_summary.update(access_table)
 
-        #print 'variables:'
-        #for k, v in variables.items():
-        #    pprint(v.to_dict())
-        #print '----------'
-        print 'lockset'
-        pprint(lockset_summary.to_dict())
-        print '---------'
-        print 'accesses:'
-        pprint(access_summary.to_dict())
+        return lockset_summary, access_summary
 
-        self.summaries[fun.decl.name] = {
-            'lockset': lockset_summary,
-            'accesses': access_summary,
-            'formals': [variables[str(arg)] for arg in fun.decl.arguments],
-            'variables': variables,
-        }
+    def analyze_dfs(self, fun, variables):
+        # Walks the same pathes as iter_pathes does, but interprets each block
+        # once per distinct path prefix. All changes of variables, lockset and
+        # access table are recorded in the undo log and reverted when the walk
+        # returns from the block, so siblings continue from the state of their
+        # common prefix without copying it.
+        log = UndoLog()
+        access_table = GuardedAccessTable()
+        access_table.log = log
+        start = log.mark()
+
+        outer = self.log, self.spawned
+        spawned = self.spawned
+        self.log, self.spawned = log, []
+        try:
+            lockset_summary, access_summary = None, None
+
+            path, repetitions = [], {}
+            stack = [(iter([fun.cfg.entry]), log.mark())]
+            while stack:
+                successors, mark = stack[-1]
+                block = next(successors, None)
+                if block is None:
+                    stack.pop()
+                    log.rollback(mark)
+                    if path:
+                        repetitions[path.pop().index] -= 1
+                    continue
+
+                if repetitions.get(block.index, 0) > RaceFinder.MAX_LEVEL:
+                    continue
+
+                path.append(block)
+                repetitions[block.index] = repetitions.get(block.index, 0) + 1
+                stack.append((iter([edge.dest for edge in block.succs]), log.mark()))
+
+                self.analyze_block(block, variables, access_table)
+
+                if block.index == fun.cfg.exit.index:
+                    self.function_stats.paths += 1
+                    self.budget.path()
+                    if lockset_summary is None:
+                        lockset_summary = variables.lockset
+                        access_summary = GuardedAccessTable(set(access_table.accesses))
+                    else:
+                        lockset_summary = lockset_summary.join(variables.lockset)
+                        access_summary.update(access_table)
+                    spawned.extend(self.spawned)
+        finally:
+            # variables are restored if the walk was interrupted
+            log.rollback(start)
+            self.log, self.spawned = outer
+
+        return lockset_summary, access_summary
+
+    def analyze_dataflow(self, fun, variables):
+        # States flowing into a block from its predecessors are joined into
+        # one state: a pointer may point to the pointees of every incoming
+        # path and a lock is acquired only if it is acquired on all of them.
+        # A block is requeued when its state grows. Values and locksets only
+        # grow by joins and there are finitely many of them, so the iteration
+        # ends however many paths the function has, also when exit is
+        # unreachable, e.g. in a thread looping forever. Accesses, thread
+        # entries and calls are collected from the fixed point states, so
+        # each access keeps the lockset of its block.
+        order = self.reverse_postorder(fun)
+        blocks = dict((block.index, block) for block in fun.cfg.basic_blocks)
+
+        start = fun.cfg.entry.index
+        states = {start: (variables.values, variables.lockset)}
+        # results of states before the fixed point are dropped
+        access_table = GuardedAccessTable()
+        outer = self.spawned, self.calls
+        self.spawned, self.calls = [], set()
+        try:
+            worklist, queued = [(order[start], start)], set([start])
+            while worklist:
+                _, index = heapq.heappop(worklist)
+                queued.remove(index)
+                block = blocks[index]
+                self.function_stats.blocks += 1
+                self.function_stats.copies += 1
+                state = Environment(variables.locations, *states[index])
+                self.analyze_block(block, state, access_table)
+
+                for edge in block.succs:
+                    dest = edge.dest.index
+                    joined = self.join_states(states.get(dest), state)
+                    if joined is None:
+                        continue
+                    states[dest] = joined
+                    if dest not in queued:
+                        queued.add(dest)
+                        heapq.heappush(worklist, (order[dest], dest))
+        finally:
+            self.spawned, self.calls = outer
 
-        #import ipdb; ipdb.set_trace()
+        access_table = GuardedAccessTable()
+        for index in sorted(states, key=order.get):
+            self.analyze_block(blocks[index], Environment(variables.locations, *states[index]),
+                               access_table)
+
+        exit_state = states.get(fun.cfg.exit.index)
+        if exit_state is None:
+            # function never returns
+            return RelativeLockset(), access_table
+        return exit_state[1], access_table
+
+    def join_states(self, joined, state):
+        # Returns values and lockset of the joined state with the state
+        # joined in, None if it does not change them
+        if joined is None:
+            return state.values, state.lockset
+
+        values = joined[0].merge(state.values, join_values)
+        lockset = joined[1].join(state.lockset)
+        if values is joined[0] and lockset is joined[1]:
+            return None
+        return values, lockset
+
+    def reverse_postorder(self, fun):
+        order, visited = [], set([fun.cfg.entry.index])
+        stack = [(fun.cfg.entry, iter(fun.cfg.entry.succs))]
+        while stack:
+            block, edges = stack[-1]
+            for edge in edges:
+                if edge.dest.index not in visited:
+                    visited.add(edge.dest.index)
+                    stack.append((edge.dest, iter(edge.dest.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block.index)
 
-    def print_info(self, fun):
-        print 'Function: {}'.format(fun.decl.name)
-        for bb in fun.cfg.basic_blocks:
-            print 'Basic block: {}'.format(str(bb))
-            for ss in bb.gimple:
-                print 'Instrruction: {}'.format(str(ss))
-                print 'Type: {}'.format(repr(ss))
+        # blocks unreachable from entry are never queued
+        count = len(order)
+        return dict((index, count - idx) for idx, index in enumerate(order))
 
     def build_pathes(self, fun):
         def walk(block, path):
             if count_repetitions(path, block) > RaceFinder.MAX_LEVEL:
                 return []
 
+            self.budget.step()
             path.append(block)
 
             if block.index == fun.cfg.exit.index:
+                self.budget.path()
                 return [path]
 
             pathes = []
@@ -339,362 +720,347 @@ class RaceFinder(gcc.IpaPass):
 
         return walk(fun.cfg.entry, [])
 
+    def iter_pathes(self, fun):
+        # Yields the same pathes as build_pathes does, but keeps in memory
+        # only the current one. The yielded list is changed when the next path
+        # is requested, so it must not be stored by the caller.
+        path, repetitions = [], {}
+        stack = [iter([fun.cfg.entry])]
+        while stack:
+            block = next(stack[-1], None)
+            if block is None:
+                # all successors of the last block are walked
+                stack.pop()
+                if path:
+                    repetitions[path.pop().index] -= 1
+                continue
+
+            if repetitions.get(block.index, 0) > RaceFinder.MAX_LEVEL:
+                continue
+
+            self.budget.step()
+            path.append(block)
+            repetitions[block.index] = repetitions.get(block.index, 0) + 1
+
+            if block.index == fun.cfg.exit.index:
+                self.budget.path()
+                yield path
+                repetitions[path.pop().index] -= 1
+                continue
+
+            stack.append(iter([edge.dest for edge in block.succs]))
+
     def analyze_path(self, fun, path, variables):
-        lockset = RelativeLockset()
         access_table = GuardedAccessTable()
 
         for block in path:
-            for stat in block.gimple:
-                #print 'Instruction: {}'.format(str(stat))
-                #print 'Type: {}'.format(repr(stat))
-                self.analyze_statement(stat, variables, lockset, access_table)
-                #print access_table.to_dict()
-                #print lockset.to_dict()
-                #print '+++++++++++++++++++++++++++++++'
+            self.analyze_block(block, variables, access_table)
+
+        return variables.lockset, access_table
+
+    def analyze_block(self, block, variables, access_table):
+        # Applies transfer of the block to the state. The transfer is the
+        # resulting alias state and lockset, accesses, thread entries and
+        # unresolved calls of the block, tabulated by the input alias state
+        # and lockset, so a block reached in the same state by many paths
+        # is interpreted once.
+        key = (block.index, variables.values, variables.lockset)
+        transfer = self.transfers.get(key)
+        if transfer is None:
+            statements, code = self.lower(block, variables)
+            self.function_stats.statements += statements
+            # charged before the state is replaced, so that the widened
+            # analysis starts from the state of the interrupted one
+            self.budget.statement(statements)
+
+            outer = self.log, self.spawned, self.calls
+            self.log, self.spawned, self.calls = NullLog(), [], set()
+            state, table = variables.fork(), GuardedAccessTable()
+            operations = self.operations
+            try:
+                for op in code:
+                    operations[op[0]](op, state, table)
+                transfer = (state.values, state.lockset, table, self.spawned, self.calls)
+            finally:
+                self.log, self.spawned, self.calls = outer
+            if len(self.transfers) >= self.MAX_TRANSFERS:
+                # the table keeps input states of all analyzed paths, so it
+                # is started again rather than grown without bound
+                self.transfers.clear()
+            self.transfers[key] = transfer
+        else:
+            self.function_stats.transfer_hits += 1
 
-        return lockset, access_table
+        values, lockset, table, spawned, calls = transfer
+        self.log.setattr(variables, 'values', values)
+        self.set_lockset(variables, lockset)
+        access_table.update(table)
+        for entry in spawned:
+            self.log.append(self.spawned, entry)
+        self.calls.update(calls)
 
     def init_variables(self, fun):
-        variables = copy.deepcopy(self.global_variables)
-        variables.update(self.init_formal_variables(fun))
-        variables.update(self.init_local_variables(fun))
+        # Initial environment is built once per function, so that repeated
+        # analyses of a recursive function see the same fake locations. The
+        # analysis forks it or rolls back all its changes.
+        variables = self.function_variables.get(fun.decl.name)
+        if variables is None:
+            # values of global variables are shared with the global environment
+            variables = Environment(
+                dict(self.global_variables.locations), self.global_variables.values)
+            self.init_formal_variables(fun, variables)
+            self.init_local_variables(fun, variables)
+            if self.oracle is not None:
+                self.init_resolved_pointers(fun, variables)
+            self.function_variables[fun.decl.name] = variables
         return variables
 
-    def init_formal_variables(self, fun):
-        formal_parameters = {}
+    def init_formal_variables(self, fun, variables):
         for decl in fun.decl.arguments:
             name, type = str(decl), decl.type 
-            formal_parameters[name] = self.init_variable(
-                name, type, visibility=Location.VISIBILITY_FORMAL)
-        return formal_parameters
+            variables.locations[name] = self.init_variable(
+                variables, name, type, visibility=Location.VISIBILITY_FORMAL)
 
-    def init_local_variables(self, fun):
-        local_variables = {}
+    def init_local_variables(self, fun, variables):
         for decl in fun.local_decls:
             name, type = str(decl), decl.type
-            local_variables[name] = self.init_variable(
-                name, type, visibility=Location.VISIBILITY_LOCAL)
-        return local_variables
-
-    def analyze_statement(self, stat, variables, lockset, access_table):
-        self.analyze_access(stat, variables, lockset, access_table)
-
-        if isinstance(stat, gcc.GimpleAssign) and len(stat.rhs) == 1:
-            lhs, rhs = stat.lhs, stat.rhs[0]
-            self.analyze_aliases(lhs, rhs, variables)
-
-        if isinstance(stat, gcc.GimpleCall):
-            self.analyze_call(stat, variables, lockset, access_table) 
-
-    def analyze_access(self, stat, variables, lockset, access_table):
-        if isinstance(stat, gcc.GimpleAssign):
-            # analyze left side of assignment
-            self.analyze_value(stat.lhs, stat, variables, lockset, access_table, GuardedAccess.WRITE)
-
-            # analyze right side of assign
-            for rhs in stat.rhs:
-                self.analyze_value(rhs, stat, variables, lockset, access_table, GuardedAccess.READ)
-
-        elif isinstance(stat, gcc.GimpleCall):
-            if stat.lhs:
-                # analyze lhs
-                self.analyze_value(stat.lhs, stat, variables, lockset, access_table, GuardedAccess.WRITE)
-
-            # analyze function arguments
-            for rhs in stat.args:
-                self.analyze_value(rhs, stat, variables, lockset, access_table, GuardedAccess.READ)
-
-        elif isinstance(stat, gcc.GimpleReturn):
-            if stat.retval:
-                # analuze returned value
-                self.analyze_value(stat.retval, stat, variables, lockset, access_table, GuardedAccess.READ)
-
-        elif isinstance(stat, gcc.GimpleLabel):
-            # nothing to do
-            pass
-
-        elif (isinstance(stat, gcc.GimpleCond) and stat.exprcode in
-                (gcc.EqExpr, gcc.NeExpr, gcc.LeExpr, gcc.LtExpr, gcc.GeExpr, gcc.GtExpr,)):
-            # analyze left and right side of compare expression
-            self.analyze_value(stat.lhs, stat, variables, lockset, access_table, GuardedAccess.READ)
-            self.analyze_value(stat.rhs, stat, variables, lockset, access_table, GuardedAccess.READ)
-        else:
-            raise Exception('Unhandled statement: {}'.format(repr(stat)))
-
-    def analyze_value(self, value, stat, variables, lockset, access_table, kind):
-        #print 'Accessed value: {} with {}'.format(str(value), repr(value))
-        if isinstance(value, gcc.SsaName):
-            self.analyze_value(value.var, stat, variables, lockset, access_table, kind)
-        elif isinstance(value, (gcc.VarDecl, gcc.ParmDecl)):
-            # p
-            location = variables[str(value)]
-            if location.is_global():
-                access_table.add(GuardedAccess(
-                    copy.deepcopy(location), copy.deepcopy(lockset), kind, stat.loc.file, stat.loc.line))
-        elif isinstance(value, gcc.MemRef):
-            # *p
-            # harcoded
-            name = str(value.operand.var) if isinstance(value.operand, gcc.SsaName) else str(value.operand)
-
-            location = variables[name]
-            if location.is_shared():
-                access_table.add(GuardedAccess(
-                    copy.deepcopy(location), copy.deepcopy(lockset), GuardedAccess.READ, stat.loc.file, stat.loc.line))
-
-            accessed = location.value.location
+            variables.locations[name] = self.init_variable(
+                variables, name, type, visibility=Location.VISIBILITY_LOCAL)
+
+    def init_resolved_pointers(self, fun, variables):
+        # Pointers the oracle resolves to globals point to all of them from
+        # the start of the function, assignments to them are not lowered
+        resolved = self.resolved[fun.decl.name] = set()
+        for decl in list(fun.decl.arguments) + list(fun.local_decls):
+            locations, complete = self.query_oracle(fun.decl.name, str(decl))
+            if complete:
+                values = [Address(location) for location in locations]
+                value = values[0] if len(values) == 1 else ValueSet(values)
+                variables.values = variables.values.set(variables[str(decl)], value)
+                resolved.add(str(decl))
+
+    def init_formal_chains(self, fun, variables):
+        # For each formal parameter returns the list of locations reachable
+        # from it in the initial environment: [p, *p, **p, ...]
+        chains = []
+        for decl in fun.decl.arguments:
+            chain, location = [], variables[str(decl)]
+            while location is not None:
+                chain.append(location)
+                value = variables.value(location)
+                location = value.location if isinstance(value, Address) else None
+            chains.append(chain)
+        return chains
+
+    def assign(self, variables, location, value):
+        self.log.setattr(variables, 'values', variables.values.set(location, value))
+
+    def set_lockset(self, variables, lockset):
+        self.log.setattr(variables, 'lockset', lockset)
+
+    def lower(self, block, variables):
+        # Returns number of statements and code of the block of the analyzed
+        # function, lowered on the first request
+        key = (self.function, block.index)
+        lowered = self.lowered.get(key)
+        if lowered is None:
+            lowered = BlockLowering(variables.locations, self.resolved.get(self.function, ())).lower(block)
+            self.lowered[key] = lowered
+        return lowered
+
+    def run_error(self, op, variables, access_table):
+        raise op[1]
+
+    def run_access(self, op, variables, access_table):
+        _, location, kind, file, line = op
+        access_table.add(GuardedAccess(location, variables.lockset, kind, file, line))
+
+    def run_deref(self, op, variables, access_table):
+        _, name, location, kind, file, line = op
+        for accessed in self.pointees(name, location, variables):
             if accessed.is_shared():
-                access_table.add(GuardedAccess(
-                    copy.deepcopy(accessed), copy.deepcopy(lockset), kind, stat.loc.file, stat.loc.line))
-        elif value is None or isinstance(value, (gcc.IntegerCst, gcc.AddrExpr, gcc.Constructor)):
-            # do nothing
-            pass
-        else:
-            raise Exception('Unexpected value: {}'.format(repr(value)))
-
-    def analyze_aliases(self, lhs, rhs, variables):
-        if isinstance(lhs, gcc.MemRef):  # *p
-            # hardcoded
-            lname = str(lhs.operand.var) if isinstance(lhs.operand, gcc.SsaName) else str(lhs.operand)
-
-            if isinstance(rhs, gcc.AddrExpr):
-                # *p = &q
-                #        q
-                #        ^   
-                #        |
-                # p ---> r
-                r = variables[lname].value.location
-                # hardcoded
-                rname = str(rhs.operand.var) if isinstance(rhs.operand, gcc.SsaName) else str(rhs.operand)
-                q = variables[rname]
-                r.value = Address(q)
-            elif isinstance(rhs, gcc.MemRef):
-                # *p = *q
-                # q ---> b ---> c
-                #               ^
-                #               |
-                #        p ---> a
-                a = variables[lname].value.location
-                # hardcoded
-                rname = str(rhs.operand.var) if isinstance(rhs.operand, gcc.SsaName) else str(rhs.operand)
-                b = variables[rname].value.location
-                a.value = b.value
-            elif isinstance(rhs, (gcc.VarDecl, gcc.ParmDecl, gcc.SsaName)):
-                # *p = q
-                # q ---> b
-                #        ^
-                #        |
-                # p ---> r
-                r = variables[lname].value.location
-                # hardcoded
-                rname = str(rhs.var) if isinstance(rhs, gcc.SsaName) else str(rhs)
-                q = variables[rname]
-                r.value = q.value
-            elif isinstance(rhs, (gcc.IntegerCst, gcc.Constructor)):
-                # do nothing
-                pass
-            else:
-                raise Exception("Unexpected rhs: {}".format(repr(rhs)))
-
-        elif isinstance(lhs, (gcc.VarDecl, gcc.ParmDecl, gcc.SsaName)):  # p
-            # hardcoded
-            lname = str(lhs.var) if isinstance(lhs, gcc.SsaName) else str(lhs)
-            if isinstance(rhs, gcc.AddrExpr):
-                # p = &q
-                # p ---> q
-                # hardcoded
-                rname = str(rhs.operand.var) if isinstance(rhs.operand, gcc.SsaName) else str(rhs.operand)
-                p = variables[lname]
-                q = variables[rname]
-                p.value = Address(q)
-            elif isinstance(rhs, gcc.MemRef):
-                # p = *q
-                # q ---> a ---> b
-                #               ^
-                #               |
-                #               p
-                # hardcoded
-                rname = str(rhs.operand.var) if isinstance(rhs.operand, gcc.SsaName) else str(rhs.operand)
-                p = variables[lname]
-                q = variables[rname]
-                a = q.value.location
-                p.value = a.value
-            elif isinstance(rhs, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
-                # p = q
-                # q ---> a
-                #        ^
-                #        |
-                #        p
-                # hardcoded
-                rname = str(rhs.var) if isinstance(rhs, gcc.SsaName) else str(rhs)
-                p = variables[lname]
-                q = variables[rname]
-                p.value = q.value
-            elif isinstance(rhs, (gcc.IntegerCst, gcc.Constructor)):
-                # nothing to do
-                pass
-            else:
-                raise Exception("Unexpected rhs: {}".format(repr(rhs)))
-        else:
-            raise Exception("Unexpected lhs: {}".format(repr(lhs)))
-
-    def analyze_call(self, stat, variables, lockset, access_table):
-        fname = str(stat.fndecl)
-        if fname == 'pthread_mutex_lock':
-            arg = stat.args[0]
-            if isinstance(arg, gcc.AddrExpr):
-                name = str(arg.operand.var) if isinstance(arg.operand, gcc.SsaName) else str(arg.operand)
-                location = variables[name]
-                lockset.acquire(Address(location))
-            elif isinstance(arg, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
-                name = str(arg.var) if isinstance(arg, gcc.SsaName) else str(arg)
-                location = variables[name]
-                lockset.acquire(location.value)
-            else:
-                raise Exception('Unexpexted argument of pthread_mutex_lock')
-        
-        elif fname == 'pthread_mutex_unlock':
-            arg = stat.args[0]
-            if isinstance(arg, gcc.AddrExpr):
-                name = str(arg.operand.var) if isinstance(arg.operand, gcc.SsaName) else str(arg.operand)
-                location = variables[name]
-                lockset.release(Address(location))
-            elif isinstance(arg, (gcc.SsaName, gcc.VarDecl, gcc.ParmDecl)):
-                name = str(arg.var) if isinstance(arg, gcc.SsaName) else str(arg)
-                location = variables[name]
-                lockset.release(location.value)
-            else:
-                raise Exception('Unexpexted argument of pthread_mutex_unlock')
-
-        elif fname == 'pthread_create':
-            called = str(stat.args[2].operand)
-            summary = self.summaries.get(called)
-            if summary is None:
-                node = self.get_node_by_name(called)
-                if node is None:
-                    raise Exception('Create thread with unexpected function: {}'.format(called))
+                access_table.add(GuardedAccess(accessed, variables.lockset, kind, file, line))
+
+    def run_assign(self, op, variables, access_table):
+        # p = q
+        self.assign(variables, op[1], variables.value(op[2]))
+
+    def run_address(self, op, variables, access_table):
+        # p = &q
+        self.assign(variables, op[1], op[2])
+
+    def run_load(self, op, variables, access_table):
+        # p = *q
+        self.assign(variables, op[1], self.load(variables, op[2]))
+
+    def run_store(self, op, variables, access_table):
+        # *p = q
+        self.store(variables, op[1], variables.value(op[2]))
+
+    def run_store_address(self, op, variables, access_table):
+        # *p = &q
+        self.store(variables, op[1], op[2])
+
+    def run_store_load(self, op, variables, access_table):
+        # *p = *q
+        self.store(variables, op[1], self.load(variables, op[2]))
+
+    def targets(self, value):
+        # Locations the pointer value points to, a value joined in
+        # MODE_DATAFLOW points to the ones of its alternatives
+        if isinstance(value, ValueSet):
+            return [alternative.location for alternative in value.values
+                    if isinstance(alternative, Address)]
+        return [value.location]
+
+    def load(self, variables, location):
+        value = None
+        for target in self.targets(variables.value(location)):
+            value = join_values(value, variables.value(target))
+        return value
+
+    def store(self, variables, location, value):
+        # Location the pointer surely points to is overwritten, others keep
+        # their values as well
+        targets = self.targets(variables.value(location))
+        if len(targets) == 1:
+            self.assign(variables, targets[0], value)
+            return
+        for target in targets:
+            self.assign(variables, target, join_values(variables.value(target), value))
+
+    def run_lock(self, op, variables, access_table):
+        _, location, lock = op
+        if lock is None:
+            lock = variables.value(location)
+        if not isinstance(lock, ValueSet):
+            # it is unknown which of the joined mutexes is acquired
+            self.set_lockset(variables, variables.lockset.acquire(lock))
+
+    def run_unlock(self, op, variables, access_table):
+        _, location, lock = op
+        if lock is None:
+            lock = variables.value(location)
+        lockset = variables.lockset
+        for alternative in alternatives(lock):
+            lockset = lockset.release(alternative)
+        self.set_lockset(variables, lockset)
+
+    def run_spawn(self, op, variables, access_table):
+        _, called, operand, file, line = op
+        summary = self.summaries.get(called)
+        if summary is None:
+            node = self.get_node_by_name(called)
+            if node is not None:
                 self.analyze_node(node)
                 summary = self.summaries[called]
-            summary = self.rebindSummary(summary, [stat.args[3],], variables)
-            self.entries.append({'name': called, 'accesses': summary['accesses']})
-
-        else:
-            summary = self.summaries.get(fname)
-            if summary is None:
-                node = self.get_node_by_name(fname)
-                if node is None:
-                    # pass call of external function
-                    return
-                self.analyze_node(node)
-                summary = self.summaries[fname]
-            summary = self.rebindSummary(summary, stat.args, variables)
-            # update current lockset and access table
-            self.update_lockset(lockset, summary['lockset'])
-            access_table.update(summary['accesses'])
-
-    def rebindSummary(self, summary, args, variables):
-        summary = copy.deepcopy(summary)
-
-        # rebind guarded access table
-        for ga in summary['accesses'].accesses:
-            if ga.access.is_formal():
-                # rebind accessed location
-                ga.access = copy.deepcopy(self.find_rebinding_location(ga.access, args, summary['formals'], variables))
-
-            # rebind relative lockset
-            ga.lockset = self.rebind_lockset(ga.lockset, args, summary['formals'], variables)
-
-        # rebind function relative lockset summary
-        summary['lockset'] = self.rebind_lockset(summary['lockset'], args, summary['formals'], variables)
-
+            elif not self.summary_file:
+                raise Exception('Create thread with unexpected function: {}'.format(called))
+        for shape in self.argument_shapes(operand, variables):
+            self.log.append(self.spawned, {
+                'name': called,
+                # accesses of function defined in other unit are found by linker
+                'accesses': self.rebind(called, summary, [shape])['accesses'] if summary else None,
+                'shape': shape,
+                'file': file,
+                'line': line,
+            })
+
+    def run_call(self, op, variables, access_table):
+        _, fname, operands = op
+        summary = self.summaries.get(fname)
+        if summary is None:
+            node = self.get_node_by_name(fname)
+            if node is None:
+                # pass call of external function, linker resolves it
+                # if it is defined in other unit
+                if self.summary_file:
+                    self.calls.update((fname, shapes) for shapes in self.call_shapes(operands, variables))
+                return
+            self.analyze_node(node)
+            summary = self.summaries[fname]
+
+        # update current lockset, access table and unresolved calls, the
+        # summary is rebound to each binding of joined arguments
+        lockset = None
+        for shapes in self.call_shapes(operands, variables):
+            rebound = self.rebind(fname, summary, shapes)
+            updated = variables.lockset.update(rebound['lockset'])
+            lockset = updated if lockset is None else lockset.join(updated)
+            access_table.update(rebound['accesses'])
+            self.calls.update(rebound['calls'])
+        self.set_lockset(variables, lockset)
+
+    def query_oracle(self, function, name):
+        # Returns global locations the pointer of the function may point to
+        # and whether it may point only to them
+        key = (function, name)
+        result = self.oracle_locations.get(key)
+        if result is None:
+            locations, complete = [], True
+            for scope, target in self.oracle.points_to(function, name):
+                location = self.global_variables.locations.get(target) if scope is None else None
+                if location is None:
+                    complete = False
+                else:
+                    locations.append(location)
+            result = self.oracle_locations[key] = locations, complete and bool(locations)
+        return result
+
+    def pointees(self, name, location, variables):
+        # Locations accessed through the pointer. Pointers the oracle resolves
+        # to globals point to them in every state, other locations are
+        # represented by the pointee in the analysis state, which is rebound
+        # to caller locations at calls. Assignments to pointers the oracle
+        # does not resolve are interpreted in every mode, so that the state
+        # follows copies of formals the oracle knows no callers of.
+        if self.oracle is None:
+            return self.targets(variables.value(location))
+
+        locations, complete = self.query_oracle(self.function, name)
+        if complete:
+            return locations
+        return locations + self.targets(variables.value(location))
+
+    def rebind(self, name, summary, shapes):
+        hits = self.rebindings.hits
+        summary = self.rebindings.rebind(name, summary, shapes)
+        self.function_stats.rebindings += 1
+        self.function_stats.rebinding_hits += self.rebindings.hits - hits
         return summary
 
-    def find_rebinding_location(self, location, args, formals, variables):
-        idx, level = self.find_parent(location, formals)
-        if idx is None or level is None:
-            import ipdb; ipdb.set_trace()
-            raise Exception('Critical error')
-
-        arg = args[idx]
-
-        need_address = False
-        if isinstance(arg, gcc.AddrExpr):
-          arg = arg.operand
-          need_address = True
-          level = level - 1
-
-        vname = str(arg.var) if isinstance(arg, gcc.SsaName) else str(arg)
-        new_location = variables[vname]
-        for idx in range(level):
-            new_location = new_location.value.location
-
-        if need_address:
-            new_location = Address(new_location)
-
-        return new_location
-
-    def find_parent(self, location, formals):
-        for idx in range(len(formals)):
-            formal, level = formals[idx], 0
-
-            while True:
-                if formal == location:
-                    return idx, level
-
-                formal = formal.value.location
-
-                if isinstance(formal, Value):
-                    break
-
-                level = level + 1
-
-        return None, None
-
-    def rebind_lockset(self, lockset, args, formals, variables):
-        return RelativeLockset(
-            self.rebind_set(lockset.acquired, args, formals, variables),
-            self.rebind_set(lockset.released, args, formals, variables)
-        )
-
-    def rebind_set(self, old_set, args, formals, variables):
-        new_set = set()
-        for value in old_set:
-            need_address = False
-
-            if isinstance(value, Address):
-                value = value.location
-
-            if value.is_formal():
-                value = self.find_rebinding_location(value, args, formals, variables)
-
-            if need_address:
-                value = Address(value)
-
-            new_set.add(copy.deepcopy(value))
-
-        return new_set
-
-    def update_lockset(self, lockset, flockset):
-        lockset.acquired = lockset.acquired.union(flockset.acquired).difference(flockset.released)
-        lockset.released = lockset.released.union(flockset.released).difference(flockset.acquired)
+    def call_shapes(self, operands, variables):
+        # Shapes of all arguments for each binding of joined arguments
+        return list(itertools.product(*[
+            self.argument_shapes(operand, variables) for operand in operands]))
+
+    def argument_shapes(self, operand, variables):
+        # Caller locations bound to formal by the actual argument, see
+        # summaries.rebind_summary and lowering.BlockLowering.operand. There
+        # is a shape for each chain of alternatives of joined pointers.
+        if operand is None:
+            return [None]
+
+        is_address, location = operand
+        shapes, stack = [], [(location, ())]
+        while stack:
+            location, chain = stack.pop()
+            chain = chain + (location,)
+            targets = [alternative.location for alternative in alternatives(variables.value(location))
+                       if isinstance(alternative, Address) and alternative.location not in chain]
+            if not targets:
+                shapes.append((is_address, chain))
+            for target in reversed(targets):
+                stack.append((target, chain))
+        return shapes
 
     def find_races(self):
-        for idx1 in range(len(self.entries) - 1):
-            for idx2 in range(idx1 + 1, len(self.entries)):
-                self.compare_accesses(self.entries[idx1], self.entries[idx2])
-
-    def compare_accesses(self, entry1, entry2):
-        print '++++++++++++++++++++++++++++++'
-        print '++++++++++++++++++++++++++++++'
-        print 'Races:'
-        for ga1 in entry1['accesses'].accesses:
-            for ga2 in entry2['accesses'].accesses:
-                if ga1.access == ga2.access and (ga1.kind == GuardedAccess.WRITE or ga2.kind == GuardedAccess.WRITE) and len(ga1.lockset.acquired.intersection(ga2.lockset.acquired)) == 0:
-                    # TODO: replace ga1.access and ga2.access !!! now it's very  bad !!!
-                    print entry1['name']
-                    pprint(ga1.to_dict())
-                    print entry2['name']
-                    pprint(ga2.to_dict())
-                    print '-----------------'
+        for entry1, entry2, races in find_races(self.entries, self.jobs):
+            self.results.races(entry1, entry2, races)
+
+    def write_summaries(self, path):
+        with open(path, 'wb') as fo:
+            fo.write(dump_summaries(sorted(self.summaries.items()), self.entries))
 
 
 ps = RaceFinder(name='race-finder')
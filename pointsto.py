@@ -0,0 +1,248 @@
+from collections import deque
+
+from callgraph import strongly_connected_components
+
+
+def bits(mask):
+    # Returns ids of nodes of the bitset in ascending order. Clearing the
+    # lowest bit copies the whole mask, so long masks are scanned as text.
+    digits = bin(mask)[:1:-1]
+    nodes = []
+    node = digits.find('1')
+    while node >= 0:
+        nodes.append(node)
+        node = digits.find('1', node + 1)
+    return nodes
+
+
+class AndersenSolver(object):
+    # Inclusion-based points-to analysis over the constraint graph. Nodes
+    # are variables and temporaries with dense integer ids, points-to sets
+    # are bitsets of the ids. Constraints are
+    #
+    #     address(p, a)   pts(p) contains a
+    #     copy(p, q)      pts(p) includes pts(q), an edge q -> p
+    #     load(p, q)      pts(p) includes pts(v) for every v in pts(q)
+    #     store(p, q)     pts(v) includes pts(q) for every v in pts(p)
+    #
+    # Solve propagates only locations a node got since it was processed
+    # last time. Loads and stores add copy edges as locations reach them.
+    # When propagation along an edge leaves both ends with equal sets, the
+    # edge may close a cycle, whose nodes are then merged into one.
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        # union-find of merged nodes
+        self.parent = []
+        self.pts = []
+        self.propagated = []
+        self.copies = []
+        self.loads = []
+        self.stores = []
+        # edges which were already checked for cycles
+        self.checked = set()
+
+    def node(self, name=None):
+        # Returns node of the named variable or a new temporary if name is None
+        if name is not None:
+            node = self.ids.get(name)
+            if node is not None:
+                return node
+
+        node = len(self.names)
+        self.names.append(name)
+        self.parent.append(node)
+        self.pts.append(0)
+        self.propagated.append(0)
+        self.copies.append(set())
+        self.loads.append([])
+        self.stores.append([])
+        if name is not None:
+            self.ids[name] = node
+        return node
+
+    def find(self, node):
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def address(self, p, a):
+        self.pts[self.find(p)] |= 1 << a
+
+    def copy(self, p, q):
+        self.copies[self.find(q)].add(p)
+
+    def load(self, p, q):
+        self.loads[self.find(q)].append(p)
+
+    def store(self, p, q):
+        self.stores[self.find(p)].append(q)
+
+    def points_to(self, node):
+        return bits(self.pts[self.find(node)])
+
+    def add_edge(self, src, dest, worklist):
+        # Adds copy edge of a load or store between representatives, dest
+        # gets all locations of src
+        if src == dest or dest in self.copies[src]:
+            return
+        self.copies[src].add(dest)
+        if self.pts[src] & ~self.pts[dest]:
+            self.pts[dest] |= self.pts[src]
+            worklist.append(dest)
+
+    def solve(self):
+        worklist = deque(node for node in range(len(self.names))
+                         if self.find(node) == node and self.pts[node])
+
+        while worklist:
+            node = self.find(worklist.popleft())
+            delta = self.pts[node] & ~self.propagated[node]
+            if not delta:
+                continue
+            self.propagated[node] |= delta
+
+            if self.loads[node] or self.stores[node]:
+                loads = set(self.find(p) for p in self.loads[node])
+                stores = set(self.find(q) for q in self.stores[node])
+                for location in set(self.find(location) for location in bits(delta)):
+                    for p in loads:
+                        self.add_edge(location, p, worklist)
+                    for q in stores:
+                        self.add_edge(q, location, worklist)
+
+            collapsed = False
+            for succ in list(self.copies[node]):
+                # node can be merged with others meanwhile
+                root, succ = self.find(node), self.find(succ)
+                if succ == root:
+                    continue
+                if delta & ~self.pts[succ]:
+                    self.pts[succ] |= delta
+                    worklist.append(succ)
+                if self.pts[succ] == self.pts[root] and (root, succ) not in self.checked:
+                    self.checked.add((root, succ))
+                    collapsed = self.collapse_cycle(root, succ) or collapsed
+            if collapsed:
+                worklist.append(self.find(node))
+
+    def collapse_cycle(self, node, succ):
+        # Merges nodes of the cycle through edge node -> succ if there is
+        # one, returns True if nodes were merged
+        def successors(key):
+            return set(self.find(dest) for dest in self.copies[key]) - set([key])
+
+        for component in strongly_connected_components([succ], successors):
+            if node in component:
+                self.merge(component)
+                return True
+        return False
+
+    def merge(self, nodes):
+        root = nodes[0]
+        for node in nodes[1:]:
+            self.parent[node] = root
+            self.pts[root] |= self.pts[node]
+            # locations which were not propagated from both nodes are
+            # propagated again
+            self.propagated[root] &= self.propagated[node]
+            self.copies[root].update(self.copies[node])
+            self.loads[root].extend(self.loads[node])
+            self.stores[root].extend(self.stores[node])
+            self.pts[node] = self.propagated[node] = None
+            self.copies[node] = self.loads[node] = self.stores[node] = None
+
+
+class SteensgaardSolver(object):
+    # Unification-based points-to analysis with the same interface as
+    # AndersenSolver. Locations pointed to by one pointer are merged into
+    # one class and every class points to at most one class, so each
+    # constraint is applied by a few union-find operations as soon as it is
+    # added. Results are a superset of the ones of AndersenSolver.
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.parent = []
+        self.size = []
+        # class pointed to by the class of a node
+        self.pointee = []
+        self.members = {}
+
+    def node(self, name=None):
+        if name is not None:
+            node = self.ids.get(name)
+            if node is not None:
+                return node
+
+        node = len(self.names)
+        self.names.append(name)
+        self.parent.append(node)
+        self.size.append(1)
+        self.pointee.append(None)
+        if name is not None:
+            self.ids[name] = node
+        return node
+
+    def find(self, node):
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def deref(self, node):
+        # Returns class pointed to by the class of node, creating it if needed
+        node = self.find(node)
+        pointee = self.pointee[node]
+        if pointee is None:
+            pointee = self.pointee[node] = self.node()
+        return self.find(pointee)
+
+    def join(self, a, b):
+        # Merges two classes and, recursively, classes they point to
+        pending = [(a, b)]
+        while pending:
+            a, b = pending.pop()
+            a, b = self.find(a), self.find(b)
+            if a == b:
+                continue
+            if self.size[a] < self.size[b]:
+                a, b = b, a
+            self.parent[b] = a
+            self.size[a] += self.size[b]
+            if self.pointee[a] is None:
+                self.pointee[a] = self.pointee[b]
+            elif self.pointee[b] is not None:
+                pending.append((self.pointee[a], self.pointee[b]))
+            self.pointee[b] = None
+
+    def address(self, p, a):
+        self.join(self.deref(p), a)
+
+    def copy(self, p, q):
+        self.join(self.deref(p), self.deref(q))
+
+    def load(self, p, q):
+        self.join(self.deref(p), self.deref(self.deref(q)))
+
+    def store(self, p, q):
+        self.join(self.deref(self.deref(p)), self.deref(q))
+
+    def solve(self):
+        # named nodes of every class, temporaries are not locations
+        self.members = {}
+        for node in range(len(self.names)):
+            if self.names[node] is not None:
+                self.members.setdefault(self.find(node), set()).add(node)
+
+    def points_to(self, node):
+        pointee = self.pointee[self.find(node)]
+        if pointee is None:
+            return set()
+        return self.members.get(self.find(pointee), set())
@@ -0,0 +1,114 @@
+# Points-to sets of all functions in one append-only store instead of a
+# file per function. Results of a function are a marshalled record of the
+# store file, its offset and length are appended to the index file next to
+# it, so readers map the store and decode only the functions they look up:
+#
+#     python pts_store.py output/pts.store main worker
+import argparse
+import fcntl
+import json
+import marshal
+import mmap
+import os
+import struct
+
+STORE_MAGIC = 'PTS\x01'
+INDEX_MAGIC = 'PTI\x01'
+INDEX_SUFFIX = '.index'
+
+# offset and length of the record, length of the function name following it
+INDEX_ENTRY = struct.Struct('<QIH')
+
+
+def write_all(fd, data):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class PointsToStore(object):
+    # Appends records of functions to the store. Parallel compilations
+    # append to the same store, so both files are written while the store
+    # is locked and the index entry follows the record it points to.
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.index_fd = os.open(path + INDEX_SUFFIX, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, function, pts):
+        # pts maps names of variables to lists of names of their locations
+        record = marshal.dumps(pts)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size == 0:
+                write_all(self.fd, STORE_MAGIC)
+            if os.fstat(self.index_fd).st_size == 0:
+                write_all(self.index_fd, INDEX_MAGIC)
+            offset = os.fstat(self.fd).st_size
+            write_all(self.fd, record)
+            write_all(self.index_fd, INDEX_ENTRY.pack(offset, len(record), len(function)) + function)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.index_fd)
+
+
+class PointsToReader(object):
+    # Looks records up in the memory-mapped store. A function appended more
+    # than once, e.g. by a rebuild, has the results of the last append.
+
+    def __init__(self, path):
+        self.offsets = {}
+        with open(path + INDEX_SUFFIX, 'rb') as fi:
+            index = fi.read()
+        if index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise Exception('Not a points-to store index: {}'.format(path + INDEX_SUFFIX))
+
+        position = len(INDEX_MAGIC)
+        # an entry can be cut by a compilation appending right now
+        while position + INDEX_ENTRY.size <= len(index):
+            offset, length, name_length = INDEX_ENTRY.unpack_from(index, position)
+            position += INDEX_ENTRY.size
+            if position + name_length > len(index):
+                break
+            self.offsets[index[position:position + name_length]] = (offset, length)
+            position += name_length
+
+        with open(path, 'rb') as fi:
+            self.map = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(STORE_MAGIC)] != STORE_MAGIC:
+            raise Exception('Not a points-to store: {}'.format(path))
+
+    def functions(self):
+        return sorted(self.offsets)
+
+    def __contains__(self, function):
+        return function in self.offsets
+
+    def lookup(self, function):
+        # Returns points-to sets of the function, only its record is decoded
+        offset, length = self.offsets[function]
+        return marshal.loads(buffer(self.map, offset, length))
+
+    def close(self):
+        self.map.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print points-to sets of a store as JSON')
+    parser.add_argument('store', help='store written with alias-store')
+    parser.add_argument('functions', nargs='*', help='functions to print, all by default')
+    args = parser.parse_args()
+
+    reader = PointsToReader(args.store)
+    try:
+        for function in args.functions or reader.functions():
+            print json.dumps({function: reader.lookup(function)}, sort_keys=True)
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
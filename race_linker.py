@@ -0,0 +1,130 @@
+# Finds races in the program compiled unit by unit. Every unit is compiled
+# with -fplugin-arg-python-race-summary-file=<file>, the files are linked
+# together: calls between units are resolved bottom-up over the callgraph
+# of unresolved calls and thread entries are bound to the linked summaries.
+#
+#     python race_linker.py [-j JOBS] [--speedup] unit1.summary unit2.summary ...
+#
+# Lockset effect of a function defined in other unit is not applied to
+# accesses which follow its call, so the linked program can report more
+# races than whole-program analysis.
+import argparse
+import sys
+
+from callgraph import strongly_connected_components
+from races import find_races, pairing_times
+from results import VERBOSITY_RACES, WRITERS, open_writer
+from summaries import GuardedAccessTable, RebindingCache, load_summaries
+
+
+class RaceLinker(object):
+    # bound of iterations over summaries of mutually recursive functions
+    MAX_RECURSION_ITERATIONS = 10
+
+    def __init__(self):
+        self.summaries = {}
+        self.linked = {}
+        self.entries = []
+        self.rebindings = RebindingCache()
+
+    def load(self, path):
+        with open(path, 'rb') as fi:
+            data = fi.read()
+        try:
+            summaries, entries = load_summaries(data)
+        except ValueError as error:
+            # fake locations are named differently by other versions, so
+            # their accesses would never match the ones of other units
+            raise Exception('{}: {}, compile the unit again'.format(path, error))
+
+        for name, summary in summaries:
+            if name in self.summaries:
+                # static functions of different units are not told apart
+                sys.stderr.write('Function {} from {} is already defined, skipped\n'.format(name, path))
+                continue
+            self.summaries[name] = summary
+        self.entries.extend(entries)
+
+    def callees(self, name):
+        # names of defined functions called from the function unresolved
+        callees = set()
+        for callee, shapes in self.summaries[name]['calls']:
+            if callee in self.summaries:
+                callees.add(callee)
+        return sorted(callees)
+
+    def link(self):
+        for component in strongly_connected_components(sorted(self.summaries), self.callees):
+            recursive = len(component) > 1 or component[0] in self.callees(component[0])
+            for iteration in range(self.MAX_RECURSION_ITERATIONS if recursive else 1):
+                changed = False
+                for name in component:
+                    changed = self.link_function(name) or changed
+                if not changed:
+                    break
+
+        entries = []
+        for entry in self.entries:
+            summary = self.linked.get(entry['name'])
+            if summary is not None:
+                summary = self.rebindings.rebind(entry['name'], summary, [entry['shape']])
+                entry = dict(entry, accesses=summary['accesses'])
+            elif entry['accesses'] is None:
+                sys.stderr.write('Create thread with unexpected function: {}\n'.format(entry['name']))
+                continue
+            entries.append(entry)
+        self.entries = entries
+
+    def link_function(self, name):
+        # Adds accesses of resolved callees to the function summary, returns
+        # True if the linked summary has changed
+        summary = self.summaries[name]
+        accesses, calls = set(summary['accesses'].accesses), set()
+        for callee, shapes in summary['calls']:
+            callee_summary = self.linked.get(callee, self.summaries.get(callee))
+            if callee_summary is None:
+                # function is external for the whole program
+                calls.add((callee, shapes))
+                continue
+
+            callee_summary = self.rebindings.rebind(callee, callee_summary, shapes)
+            accesses.update(callee_summary['accesses'].accesses)
+            calls.update(call for call in callee_summary['calls'] if call[0] not in self.summaries)
+
+        previous = self.linked.get(name)
+        self.linked[name] = dict(summary, accesses=GuardedAccessTable(accesses), calls=frozenset(calls))
+        return previous is None or previous['accesses'].accesses != accesses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find races in linked unit summaries')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes comparing thread entries, 0 for all cores')
+    parser.add_argument('--speedup', action='store_true',
+                        help='report time of parallel race pairing against the serial one')
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS), default='text',
+                        help='format of the results')
+    parser.add_argument('-o', '--output', help='file the results are written to')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    linker = RaceLinker()
+    for path in args.files:
+        linker.load(path)
+    linker.link()
+
+    results = open_writer(args.format, args.output, VERBOSITY_RACES)
+    try:
+        for entry1, entry2, races in find_races(linker.entries, args.jobs):
+            results.races(entry1, entry2, races)
+
+        if args.speedup:
+            serial, parallel = pairing_times(linker.entries, args.jobs)
+            results.message('Race pairing: serial {:.3f}s, parallel {:.3f}s, speedup {:.2f}'.format(
+                serial, parallel, serial / parallel if parallel else 0.0))
+    finally:
+        results.close()
+
+
+if __name__ == '__main__':
+    main()
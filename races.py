@@ -0,0 +1,107 @@
+import multiprocessing
+import time
+
+from summaries import GuardedAccess
+
+# access tables of thread entries compared by worker processes, they are
+# inherited by fork, so interned accesses keep their identity in workers
+_tables = None
+
+
+class IndexedAccesses(object):
+    # Accesses of thread entry in a list and positions of writes and reads
+    # of every accessed location in it
+
+    def __init__(self, table):
+        self.accesses = list(table.accesses)
+        self.locations = {}
+        for position in range(len(self.accesses)):
+            ga = self.accesses[position]
+            writes, reads = self.locations.setdefault(ga.access, ([], []))
+            if ga.kind == GuardedAccess.WRITE:
+                writes.append(position)
+            else:
+                reads.append(position)
+
+
+def compare_indexed(indexed1, indexed2):
+    # Returns positions of racing accesses: accesses to the same location,
+    # at least one of them writes and no lock is held by both threads.
+    # Locations are joined by the smaller index, only accesses to common
+    # locations are compared.
+    locations1, locations2 = indexed1.locations, indexed2.locations
+    races = []
+    for location in (locations1 if len(locations1) <= len(locations2) else locations2):
+        if location not in locations1 or location not in locations2:
+            continue
+        writes1, reads1 = locations1[location]
+        writes2, reads2 = locations2[location]
+        for positions1, positions2 in ((writes1, writes2), (writes1, reads2), (reads1, writes2)):
+            for position1 in positions1:
+                acquired = indexed1.accesses[position1].lockset.acquired
+                for position2 in positions2:
+                    if not acquired & indexed2.accesses[position2].lockset.acquired:
+                        races.append((position1, position2))
+
+    # the order of nested loops over both tables
+    races.sort()
+    return races
+
+
+def compare_accesses(entry1, entry2, indexed1=None, indexed2=None):
+    # Returns list of pairs of racing accesses made by two thread entries
+    indexed1 = indexed1 or IndexedAccesses(entry1['accesses'])
+    indexed2 = indexed2 or IndexedAccesses(entry2['accesses'])
+    # TODO: replace ga1.access and ga2.access !!! now it's very  bad !!!
+    return [(indexed1.accesses[position1], indexed2.accesses[position2])
+            for position1, position2 in compare_indexed(indexed1, indexed2)]
+
+
+def compare_tables(pair):
+    # Returns positions of racing accesses of pair of entries in a worker
+    return compare_indexed(_tables[pair[0]], _tables[pair[1]])
+
+
+def find_races(entries, jobs=1):
+    # Yields (entry1, entry2, races) for every pair of thread entries.
+    # Pairs are compared by a pool of jobs processes (all cores if jobs is
+    # 0), results come in the same order as in the serial run.
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+
+    pairs = [(idx1, idx2) for idx1 in range(len(entries) - 1)
+             for idx2 in range(idx1 + 1, len(entries))]
+    tables = [IndexedAccesses(entry['accesses']) for entry in entries]
+
+    if jobs <= 1 or len(pairs) <= 1:
+        for idx1, idx2 in pairs:
+            yield entries[idx1], entries[idx2], compare_accesses(
+                entries[idx1], entries[idx2], tables[idx1], tables[idx2])
+        return
+
+    global _tables
+    _tables = tables
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(compare_tables, pairs, max(1, len(pairs) // (jobs * 4)))
+    finally:
+        pool.terminate()
+        pool.join()
+        _tables = None
+
+    for (idx1, idx2), races in zip(pairs, results):
+        yield entries[idx1], entries[idx2], [
+            (tables[idx1].accesses[position1], tables[idx2].accesses[position2])
+            for position1, position2 in races]
+
+
+def pairing_times(entries, jobs):
+    # Returns times of the serial and the parallel race pairing
+    times = []
+    for pool_jobs in (1, jobs):
+        start = time.time()
+        for entry1, entry2, races in find_races(entries, pool_jobs):
+            pass
+        times.append(time.time() - start)
+    return times
+
@@ -0,0 +1,38 @@
+# Runs analyses on GIMPLE captured by capture.py without the compiler:
+#
+#     python replay.py test.capture plugin.py --arg race-mode=dataflow
+#
+# Scripts import offline/gcc.py as gcc module, their passes are run over
+# the captured functions and callgraph the way gcc runs them.
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run analyses on captured GIMPLE')
+    parser.add_argument('capture', help='file written by capture.py')
+    parser.add_argument('scripts', nargs='+', help='analysis scripts, e.g. plugin.py')
+    parser.add_argument('--arg', action='append', default=[],
+                        help='plugin argument name=value, as -fplugin-arg-python-<name>=<value>')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, 'offline'))
+    import gcc
+
+    gcc.load(args.capture)
+    for arg in args.arg:
+        name, _, value = arg.partition('=')
+        gcc.argument_dict[name] = value
+
+    for script in args.scripts:
+        script = os.path.abspath(script)
+        execfile(script, {'__name__': '__main__', '__file__': script})
+
+    gcc.run_passes()
+
+
+if __name__ == '__main__':
+    main()
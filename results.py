@@ -0,0 +1,178 @@
+from pprint import pprint
+import json
+import sys
+
+# what is written besides races
+VERBOSITY_RACES = 0
+VERBOSITY_SUMMARIES = 1
+
+# size of the buffer of result files
+BUFFER_SIZE = 1 << 16
+
+
+def describe(obj):
+    # Short name of accessed location or lock
+    if hasattr(obj, 'location'):
+        return '&' + describe(obj.location)
+    return getattr(obj, 'name', None) or repr(obj)
+
+
+class ResultWriter(object):
+    # Receives analysis results, writers skip results above their verbosity
+    # before any formatting is done
+
+    def __init__(self, output=None, verbosity=VERBOSITY_SUMMARIES):
+        self.verbosity = verbosity
+        if output is None or output == '-':
+            self.output, self.owned = sys.stdout, False
+        else:
+            self.output, self.owned = open(output, 'w', BUFFER_SIZE), True
+
+    def function(self, name):
+        # analysis of the function starts
+        pass
+
+    def summary(self, name, lockset, accesses):
+        pass
+
+    def races(self, entry1, entry2, races):
+        pass
+
+    def message(self, text):
+        pass
+
+    def close(self):
+        if self.owned:
+            self.output.close()
+        else:
+            self.output.flush()
+
+
+class TextWriter(ResultWriter):
+    # Human readable output printed by the plugin from the beginning
+
+    def function(self, name):
+        if self.verbosity < VERBOSITY_SUMMARIES:
+            return
+        self.output.write('===========================================\n')
+        self.output.write('Analyzed: {}\n'.format(name))
+
+    def summary(self, name, lockset, accesses):
+        if self.verbosity < VERBOSITY_SUMMARIES:
+            return
+        self.output.write('lockset\n')
+        pprint(lockset.to_dict(), self.output)
+        self.output.write('---------\n')
+        self.output.write('accesses:\n')
+        pprint(accesses.to_dict(), self.output)
+
+    def races(self, entry1, entry2, races):
+        self.output.write('++++++++++++++++++++++++++++++\n')
+        self.output.write('++++++++++++++++++++++++++++++\n')
+        self.output.write('Races:\n')
+        for ga1, ga2 in races:
+            self.output.write('{}\n'.format(entry1['name']))
+            pprint(ga1.to_dict(), self.output)
+            self.output.write('{}\n'.format(entry2['name']))
+            pprint(ga2.to_dict(), self.output)
+            self.output.write('-----------------\n')
+
+    def message(self, text):
+        self.output.write(text + '\n')
+
+
+class JsonLinesWriter(ResultWriter):
+    # One JSON object per line, its 'kind' is summary, race or message
+
+    def write(self, record):
+        self.output.write(json.dumps(record, separators=(',', ':')))
+        self.output.write('\n')
+
+    def summary(self, name, lockset, accesses):
+        if self.verbosity < VERBOSITY_SUMMARIES:
+            return
+        self.write({
+            'kind': 'summary',
+            'function': name,
+            'lockset': lockset.to_dict(),
+            'accesses': accesses.to_dict(),
+        })
+
+    def races(self, entry1, entry2, races):
+        for ga1, ga2 in races:
+            self.write({
+                'kind': 'race',
+                'threads': [
+                    {'name': entry1['name'], 'file': entry1['file'], 'line': entry1['line']},
+                    {'name': entry2['name'], 'file': entry2['file'], 'line': entry2['line']},
+                ],
+                'accesses': [ga1.to_dict(), ga2.to_dict()],
+            })
+
+    def message(self, text):
+        self.write({'kind': 'message', 'text': text})
+
+
+class SarifWriter(ResultWriter):
+    # SARIF 2.1.0 log with a result for each race. Results are written as
+    # soon as they are found, the log is completed by close. Summaries are
+    # not results, so they are left out.
+    SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+    RULE = 'data-race'
+
+    def __init__(self, *args, **kwargs):
+        super(SarifWriter, self).__init__(*args, **kwargs)
+        self.count = 0
+        tool = {'driver': {
+            'name': 'race-finder',
+            'rules': [{
+                'id': self.RULE,
+                'shortDescription': {'text': 'Unsynchronized accesses to shared location'},
+            }],
+        }}
+        self.output.write('{{"$schema":{},"version":"2.1.0","runs":[{{"tool":{},"results":['.format(
+            json.dumps(self.SCHEMA), json.dumps(tool, separators=(',', ':'))))
+
+    def location(self, ga, thread):
+        location = {
+            'message': {'text': '{} of {} in thread {}'.format(
+                ga.kind, describe(ga.access), thread)},
+        }
+        # statements without location have neither file nor line, SARIF
+        # allows no nulls in place of them
+        if ga.file is not None:
+            location['physicalLocation'] = {'artifactLocation': {'uri': ga.file}}
+            if ga.line is not None:
+                location['physicalLocation']['region'] = {'startLine': ga.line}
+        return location
+
+    def races(self, entry1, entry2, races):
+        for ga1, ga2 in races:
+            if self.count:
+                self.output.write(',')
+            self.count += 1
+            self.output.write(json.dumps({
+                'ruleId': self.RULE,
+                'level': 'warning',
+                'message': {'text': 'Race on {} between threads {} and {}'.format(
+                    describe(ga1.access), entry1['name'], entry2['name'])},
+                'locations': [self.location(ga1, entry1['name'])],
+                'relatedLocations': [self.location(ga2, entry2['name'])],
+            }, separators=(',', ':')))
+
+    def close(self):
+        self.output.write(']}]}\n')
+        super(SarifWriter, self).close()
+
+
+WRITERS = {
+    'text': TextWriter,
+    'jsonl': JsonLinesWriter,
+    'sarif': SarifWriter,
+}
+
+
+def open_writer(format, output=None, verbosity=VERBOSITY_SUMMARIES):
+    if format not in WRITERS:
+        raise Exception('Unknown result format: {}'.format(format))
+    return WRITERS[format](output, verbosity)
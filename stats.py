@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+import json
+import time
+
+
+class FunctionStats(object):
+    # Counters of the analysis of a function, accumulated over all its
+    # analyses (functions of recursive components are analyzed repeatedly)
+    FIELDS = (
+        'analyses',        # number of times the function was analyzed
+        'paths',           # entry-to-exit paths interpreted
+        'blocks',          # basic blocks interpreted in the dataflow mode
+        'statements',      # GIMPLE statements interpreted
+        'transfer_hits',   # blocks applied from the transfer of an earlier visit in the same state
+        'time',            # wall time of the analyses, including callees analyzed meanwhile
+        'copies',          # copies of the analysis state
+        'accesses',        # size of the access table of the last summary
+        'locks',           # locks in the relative lockset of the last summary
+        'rebindings',      # callee summaries rebound to call sites
+        'rebinding_hits',  # rebindings found in the rebinding cache
+        'cached',          # summary was loaded from the summary cache
+        'widened',         # path budget was exceeded, summary was computed by dataflow
+    )
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+
+class Statistics(object):
+    # Per function counters and timings of the analysis phases
+
+    def __init__(self):
+        self.functions = {}
+        self.phases = []
+
+    def function(self, name):
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = FunctionStats()
+        return stats
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+
+    def to_dict(self):
+        return {
+            'phases': [{'name': name, 'time': duration} for name, duration in self.phases],
+            'functions': dict((name, stats.to_dict())
+                              for name, stats in self.functions.items()),
+        }
+
+    def write(self, path):
+        with open(path, 'w') as fo:
+            json.dump(self.to_dict(), fo, indent=1, sort_keys=True, separators=(',', ': '))
+            fo.write('\n')
@@ -0,0 +1,764 @@
+import itertools
+import marshal
+
+
+class NullLog(object):
+    # Applies changes of analysis state without recording them
+
+    def setattr(self, obj, name, value):
+        setattr(obj, name, value)
+
+    def add(self, collection, item):
+        collection.add(item)
+
+    def remove(self, collection, item):
+        collection.remove(item)
+
+    def update(self, collection, items):
+        collection.update(items)
+
+    def append(self, array, item):
+        array.append(item)
+
+
+class UndoLog(NullLog):
+    # Applies changes of analysis state and records how to revert them, so
+    # that the state can be rolled back to any of the previous marks
+
+    def __init__(self):
+        self.changes = []
+
+    def mark(self):
+        return len(self.changes)
+
+    def rollback(self, mark):
+        while len(self.changes) > mark:
+            undo, args = self.changes.pop()
+            undo(*args)
+
+    def setattr(self, obj, name, value):
+        self.changes.append((setattr, (obj, name, getattr(obj, name))))
+        setattr(obj, name, value)
+
+    def add(self, collection, item):
+        if item not in collection:
+            self.changes.append((collection.remove, (item,)))
+            collection.add(item)
+
+    def remove(self, collection, item):
+        self.changes.append((collection.add, (item,)))
+        collection.remove(item)
+
+    def update(self, collection, items):
+        for item in items:
+            self.add(collection, item)
+
+    def append(self, array, item):
+        # array can be extended by others meanwhile, so remove item by index
+        self.changes.append((array.__delitem__, (len(array),)))
+        array.append(item)
+
+
+class Interned(object):
+    # Base of immutable value classes. Instances are hash-consed: there is
+    # only one instance for each class and values of fields, so equality is
+    # identity and hash is computed once when the instance is created.
+    __slots__ = ('hash',)
+    fields = ()
+    instances = {}
+
+    @classmethod
+    def intern(cls, *values):
+        key = (cls,) + values
+        instance = cls.instances.get(key)
+        if instance is None:
+            instance = object.__new__(cls)
+            for name, value in zip(cls.fields, values):
+                object.__setattr__(instance, name, value)
+            object.__setattr__(instance, 'hash', hash(key))
+            cls.instances[key] = instance
+        return instance
+
+    def __hash__(self):
+        return self.hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+
+class LockTable(object):
+    # Numbers locks in order of their appearance, so that sets of locks are
+    # kept as bitmasks of their numbers
+
+    def __init__(self):
+        self.ids = {}
+        self.locks = []
+
+    def id(self, lock):
+        lock_id = self.ids.get(lock)
+        if lock_id is None:
+            lock_id = self.ids[lock] = len(self.locks)
+            self.locks.append(lock)
+        return lock_id
+
+    def mask(self, locks):
+        mask = 0
+        for lock in locks:
+            mask |= 1 << self.id(lock)
+        return mask
+
+    def locks_of(self, mask):
+        locks = []
+        while mask:
+            low = mask & -mask
+            locks.append(self.locks[low.bit_length() - 1])
+            mask ^= low
+        return locks
+
+
+# the lock table shared by all locksets of the process
+LOCKS = LockTable()
+
+
+class RelativeLockset(Interned):
+    # acquired and released are bitmasks of lock ids in LOCKS
+    __slots__ = ('acquired', 'released')
+    fields = ('acquired', 'released')
+
+    def __new__(cls, acquired=(), released=()):
+        return cls.intern(LOCKS.mask(acquired), LOCKS.mask(released))
+
+    @classmethod
+    def from_masks(cls, acquired, released):
+        return cls.intern(acquired, released)
+
+    def acquired_locks(self):
+        return LOCKS.locks_of(self.acquired)
+
+    def released_locks(self):
+        return LOCKS.locks_of(self.released)
+
+    def to_dict(self):
+        return {
+            'acquired': [l.to_dict() for l in self.acquired_locks()],
+            'released': [l.to_dict() for l in self.released_locks()],
+        }
+
+    def acquire(self, lock):
+        bit = 1 << LOCKS.id(lock)
+        return self.from_masks(self.acquired | bit, self.released & ~bit)
+
+    def release(self, lock):
+        bit = 1 << LOCKS.id(lock)
+        if self.acquired & bit:
+            return self.from_masks(self.acquired & ~bit, self.released)
+        return self.from_masks(self.acquired, self.released | bit)
+
+    def join(self, lockset):
+        return self.from_masks(self.acquired & lockset.acquired, self.released | lockset.released)
+
+    def update(self, lockset):
+        # lockset after the call of function with relative lockset summary
+        return self.from_masks(
+            (self.acquired | lockset.acquired) & ~lockset.released,
+            (self.released | lockset.released) & ~lockset.acquired
+        )
+
+
+class GuardedAccess(Interned):
+    READ = 'read'
+    WRITE = 'write'
+
+    __slots__ = ('access', 'lockset', 'kind', 'file', 'line')
+    fields = ('access', 'lockset', 'kind', 'file', 'line')
+
+    def __new__(cls, access, lockset, kind, file=None, line=None):
+        return cls.intern(access, lockset, kind, file, line)
+
+    def to_dict(self):
+        return {
+            'access': self.access.to_dict(),
+            'lockset': self.lockset.to_dict(),
+            'kind': self.kind,
+            'file': self.file,
+            'line': self.line,
+        }
+
+
+class GuardedAccessTable(object):
+    log = NullLog()
+
+    def __init__(self, accesses=None):
+        self.accesses = accesses or set()
+
+    def to_dict(self):
+        return [ga.to_dict() for ga in self.accesses]
+
+    def add(self, access):
+        self.log.add(self.accesses, access)
+
+    def update(self, table):
+        self.log.update(self.accesses, table.accesses)
+
+
+class Type(Interned):
+    __slots__ = ('name',)
+    fields = ('name',)
+
+    def __new__(cls, name):
+        return cls.intern(name)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+        }
+
+
+class PointerType(Type):
+    __slots__ = ('type',)
+    fields = ('name', 'type')
+
+    def __new__(cls, type):
+        return cls.intern('pointer', type)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': self.type.to_dict(),
+        }
+
+
+class Location(Interned):
+    VISIBILITY_GLOBAL = 'global'
+    VISIBILITY_LOCAL = 'local'
+    VISIBILITY_FORMAL = 'formal'
+
+    STATUS_COMMON = 'common'
+    STATUS_FAKE = 'fake'
+
+    __slots__ = ('name', 'type', 'visibility', 'status')
+    fields = ('name', 'type', 'visibility', 'status')
+
+    def __new__(cls, name, type, visibility, status):
+        return cls.intern(name, type, visibility, status)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': self.type.to_dict(),
+            'visibility': self.visibility,
+            'status': self.status,
+        }
+
+    def is_shared(self):
+        return self.visibility in (self.VISIBILITY_GLOBAL, self.VISIBILITY_FORMAL)
+
+    def is_global(self):
+        return self.visibility == self.VISIBILITY_GLOBAL
+
+    def is_formal(self):
+        return self.visibility == self.VISIBILITY_FORMAL
+
+    def is_fake(self):
+        return self.status == self.STATUS_FAKE
+
+
+class Address(Interned):
+    __slots__ = ('location',)
+    fields = ('location',)
+
+    def __new__(cls, location):
+        return cls.intern(location)
+
+    def to_dict(self):
+        return {
+            'address_of': self.location.to_dict()
+        }
+
+
+class Value(Interned):
+    # Unknown value, each created value differs from all others
+    ids = itertools.count()
+
+    __slots__ = ('id',)
+    fields = ('id',)
+
+    def __new__(cls):
+        return cls.intern(next(cls.ids))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+        }
+
+
+class ValueSet(Interned):
+    # Value of a location joined from several paths, it is any of the
+    # alternatives. Alternatives are addresses and values, never sets.
+    __slots__ = ('values',)
+    fields = ('values',)
+
+    def __new__(cls, values):
+        return cls.intern(frozenset(values))
+
+    def to_dict(self):
+        return {
+            'any_of': [value.to_dict() for value in self.values],
+        }
+
+
+def alternatives(value):
+    return value.values if isinstance(value, ValueSet) else (value,)
+
+
+def join_values(value, other):
+    # Returns value which is any of both values, value itself if other is
+    # already one of its alternatives
+    if value is other or other is None:
+        return value
+    if value is None:
+        return other
+
+    values = set(alternatives(value))
+    values.update(alternatives(other))
+    if len(values) == len(alternatives(value)):
+        return value
+    return ValueSet(values)
+
+
+class PersistentMap(object):
+    # Immutable hash array mapped trie. Every level of the trie is indexed by
+    # the next BITS bits of key hash, set copies only the nodes on the way to
+    # the changed key and shares all others with the old map.
+    BITS = 5
+    MASK = (1 << BITS) - 1
+
+    def __init__(self, root=None):
+        # node is a dict of subnodes and buckets, bucket is a pair of hash
+        # and a tuple of (key, value) pairs with this hash
+        self.root = root or {}
+
+    def get(self, key, default=None):
+        node, keyhash, shift = self.root, hash(key), 0
+        while True:
+            entry = node.get((keyhash >> shift) & self.MASK)
+            if entry is None:
+                return default
+            if isinstance(entry, dict):
+                node, shift = entry, shift + self.BITS
+                continue
+            for k, v in entry[1]:
+                if k == key:
+                    return v
+            return default
+
+    def set(self, key, value):
+        return PersistentMap(self.assoc(self.root, 0, hash(key), key, value))
+
+    def assoc(self, node, shift, keyhash, key, value):
+        idx = (keyhash >> shift) & self.MASK
+        node = dict(node)
+        entry = node.get(idx)
+        if entry is None:
+            node[idx] = (keyhash, ((key, value),))
+        elif isinstance(entry, dict):
+            node[idx] = self.assoc(entry, shift + self.BITS, keyhash, key, value)
+        elif entry[0] == keyhash:
+            items = tuple((k, v) for k, v in entry[1] if k != key)
+            node[idx] = (keyhash, items + ((key, value),))
+        else:
+            # hashes differ, so move old bucket one level down
+            subnode = {(entry[0] >> (shift + self.BITS)) & self.MASK: entry}
+            node[idx] = self.assoc(subnode, shift + self.BITS, keyhash, key, value)
+        return node
+
+    def merge(self, other, combine):
+        # Returns map with keys of both maps, values of keys in both maps are
+        # combine(value, other value). Nodes shared by the maps are skipped,
+        # so merging maps forked from each other costs as much as the changes
+        # made since. Returns self if no value changed.
+        root = self.merge_nodes(self.root, other.root, 0, combine)
+        return self if root is self.root else PersistentMap(root)
+
+    def merge_nodes(self, node, other, shift, combine):
+        if node is other:
+            return node
+
+        merged = node
+        for idx, entry in other.items():
+            current = node.get(idx)
+            if current is None:
+                value = entry
+            else:
+                value = self.merge_entries(current, entry, shift + self.BITS, combine)
+            if value is not current:
+                if merged is node:
+                    merged = dict(node)
+                merged[idx] = value
+        return merged
+
+    def merge_entries(self, entry, other, shift, combine):
+        # Merges subnodes or buckets found at the same index, shift is the
+        # shift of the level below them
+        if entry is other:
+            return entry
+        if isinstance(entry, dict) or isinstance(other, dict) or entry[0] != other[0]:
+            # bucket is moved one level down, as assoc does
+            if not isinstance(entry, dict):
+                entry = {(entry[0] >> shift) & self.MASK: entry}
+            if not isinstance(other, dict):
+                other = {(other[0] >> shift) & self.MASK: other}
+            return self.merge_nodes(entry, other, shift, combine)
+
+        items, changed = list(entry[1]), False
+        for key, value in other[1]:
+            for idx in range(len(items)):
+                if items[idx][0] == key:
+                    combined = combine(items[idx][1], value)
+                    if combined is not items[idx][1]:
+                        items[idx] = (key, combined)
+                        changed = True
+                    break
+            else:
+                items.append((key, value))
+                changed = True
+        return (entry[0], tuple(items)) if changed else entry
+
+    def items(self):
+        stack = [self.root]
+        while stack:
+            for entry in stack.pop().values():
+                if isinstance(entry, dict):
+                    stack.append(entry)
+                else:
+                    for item in entry[1]:
+                        yield item
+
+
+class Environment(object):
+    # Locations of variables by their names, values stored in locations and
+    # the current relative lockset. Locations are never changed, values are
+    # kept in a persistent map and lockset is immutable, so forking an
+    # environment costs O(1) and assignment copies only a branch of the map.
+
+    def __init__(self, locations=None, values=None, lockset=None):
+        self.locations = locations if locations is not None else {}
+        self.values = values if values is not None else PersistentMap()
+        self.lockset = lockset if lockset is not None else RelativeLockset()
+
+    def __getitem__(self, name):
+        return self.locations[name]
+
+    def value(self, location):
+        return self.values.get(location)
+
+    def fork(self):
+        return Environment(self.locations, self.values, self.lockset)
+
+
+# Summary of a function is a dict with its relative 'lockset', table of
+# guarded 'accesses', 'formals' - chains of locations reachable from each
+# formal parameter, 'calls' - set of (function name, argument shapes)
+# of calls which could not be resolved while the function was analyzed and
+# 'widened' - the exceeded bound if the function was widened to dataflow,
+# otherwise None.
+#
+# Shape of an actual argument describes the caller locations which callee
+# formal and its pointees are bound to: a pair of flag telling whether
+# address of a variable was passed and the chain [v, *v, **v, ...] of that
+# variable. Shape is None if the argument is not a variable.
+
+
+def find_parent(location, formals):
+    # Returns index of formal and level of location in its chain
+    for idx in range(len(formals)):
+        chain = formals[idx]
+        if location in chain:
+            return idx, chain.index(location)
+
+    return None, None
+
+
+def rebind_location(location, shapes, formals):
+    # Returns caller location for callee formal location or None if
+    # the caller has no such location
+    idx, level = find_parent(location, formals)
+    if idx is None or level is None:
+        raise Exception('Critical error')
+
+    if idx >= len(shapes) or shapes[idx] is None:
+        return None
+
+    is_address, chain = shapes[idx]
+    if is_address:
+        # pointee of formal is the variable itself
+        level = level - 1
+
+    if level < 0:
+        # formal itself is rebound to the address of variable
+        return Address(chain[0])
+
+    if level >= len(chain):
+        return None
+
+    return chain[level]
+
+
+def rebind_set(old_set, shapes, formals):
+    new_set = set()
+    for value in old_set:
+        need_address = False
+
+        if isinstance(value, Address):
+            value = value.location
+            need_address = True
+
+        if isinstance(value, Location) and value.is_formal():
+            value = rebind_location(value, shapes, formals)
+            if value is None:
+                continue
+
+        if need_address:
+            value = Address(value)
+
+        new_set.add(value)
+
+    return new_set
+
+
+def rebind_lockset(lockset, shapes, formals):
+    return RelativeLockset(
+        rebind_set(lockset.acquired_locks(), shapes, formals),
+        rebind_set(lockset.released_locks(), shapes, formals)
+    )
+
+
+def rebind_shape(shape, shapes, formals):
+    # Rebinds shape of an argument passed by callee to the caller
+    if shape is None:
+        return None
+
+    is_address, chain = shape
+    if not (isinstance(chain[0], Location) and chain[0].is_formal()):
+        return shape
+
+    idx, level = find_parent(chain[0], formals)
+    if idx is None or idx >= len(shapes) or shapes[idx] is None:
+        return None
+
+    caller_is_address, caller_chain = shapes[idx]
+    if caller_is_address:
+        level = level - 1
+
+    if level < 0:
+        # callee passes its formal which holds address of caller variable
+        return None if is_address else (True, caller_chain)
+
+    if level >= len(caller_chain):
+        return None
+
+    return is_address, caller_chain[level:]
+
+
+def rebind_summary(summary, shapes):
+    # Rebinds callee summary to the caller which passes arguments of shapes
+    formals = summary['formals']
+
+    # rebind guarded access table
+    accesses = GuardedAccessTable()
+    for ga in summary['accesses'].accesses:
+        access = ga.access
+        if isinstance(access, Location) and access.is_formal():
+            # rebind accessed location
+            access = rebind_location(access, shapes, formals)
+            if access is None:
+                continue
+
+        # rebind relative lockset
+        lockset = rebind_lockset(ga.lockset, shapes, formals)
+
+        accesses.add(GuardedAccess(access, lockset, ga.kind, ga.file, ga.line))
+
+    calls = set()
+    for name, call_shapes in summary['calls']:
+        calls.add((name, tuple(rebind_shape(shape, shapes, formals) for shape in call_shapes)))
+
+    return {
+        # rebind function relative lockset summary
+        'lockset': rebind_lockset(summary['lockset'], shapes, formals),
+        'accesses': accesses,
+        'formals': formals,
+        'calls': frozenset(calls),
+    }
+
+
+class RebindingCache(object):
+    # Summaries rebound to call sites by callee name and argument shapes.
+    # Rebound summary is reused while the callee summary is the same object,
+    # recursive functions replace their summaries on every iteration.
+
+    def __init__(self):
+        self.rebound = {}
+        self.hits = 0
+        self.misses = 0
+
+    def rebind(self, name, summary, shapes):
+        key = (name, tuple(shapes))
+        cached = self.rebound.get(key)
+        if cached is not None and cached[0] is summary:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        rebound = rebind_summary(summary, key[1])
+        self.rebound[key] = (summary, rebound)
+        return rebound
+
+
+# summaries are written as nested tuples of builtin values, which marshal
+# dumps and loads much faster than pickle does
+FORMAT_VERSION = 4
+
+TERM_TYPE = 0
+TERM_POINTER_TYPE = 1
+TERM_LOCATION = 2
+TERM_ADDRESS = 3
+TERM_VALUE = 4
+TERM_LOCKSET = 5
+TERM_ACCESS = 6
+
+
+class SummaryEncoder(object):
+    # Every interned object is written once into the table of terms, others
+    # refer to it by its index in the table
+
+    def __init__(self):
+        self.terms = []
+        self.indexes = {}
+
+    def encode(self, obj):
+        idx = self.indexes.get(obj)
+        if idx is not None:
+            return idx
+
+        if isinstance(obj, PointerType):
+            term = (TERM_POINTER_TYPE, self.encode(obj.type))
+        elif isinstance(obj, Type):
+            term = (TERM_TYPE, obj.name)
+        elif isinstance(obj, Location):
+            term = (TERM_LOCATION, obj.name, self.encode(obj.type), obj.visibility, obj.status)
+        elif isinstance(obj, Address):
+            term = (TERM_ADDRESS, self.encode(obj.location))
+        elif isinstance(obj, Value):
+            term = (TERM_VALUE,)
+        elif isinstance(obj, RelativeLockset):
+            term = (TERM_LOCKSET, self.encode_all(obj.acquired_locks()),
+                    self.encode_all(obj.released_locks()))
+        elif isinstance(obj, GuardedAccess):
+            term = (TERM_ACCESS, self.encode(obj.access), self.encode(obj.lockset),
+                    obj.kind, obj.file, obj.line)
+        else:
+            raise Exception('Unexpected object in summary: {}'.format(repr(obj)))
+
+        idx = self.indexes[obj] = len(self.terms)
+        self.terms.append(term)
+        return idx
+
+    def encode_all(self, objs):
+        return tuple(self.encode(obj) for obj in objs)
+
+    def encode_shape(self, shape):
+        if shape is None:
+            return None
+        return shape[0], self.encode_all(shape[1])
+
+    def encode_summary(self, summary):
+        return (
+            self.encode(summary['lockset']),
+            self.encode_all(summary['accesses'].accesses),
+            tuple(self.encode_all(chain) for chain in summary['formals']),
+            tuple((name, tuple(self.encode_shape(shape) for shape in shapes))
+                  for name, shapes in summary['calls']),
+            summary['widened'],
+        )
+
+    def encode_entry(self, entry):
+        accesses = entry['accesses']
+        return (
+            entry['name'],
+            self.encode_all(accesses.accesses) if accesses is not None else None,
+            self.encode_shape(entry['shape']),
+            entry['file'],
+            entry['line'],
+        )
+
+
+def decode_terms(terms):
+    objs = []
+    for term in terms:
+        kind = term[0]
+        if kind == TERM_TYPE:
+            obj = Type(term[1])
+        elif kind == TERM_POINTER_TYPE:
+            obj = PointerType(objs[term[1]])
+        elif kind == TERM_LOCATION:
+            obj = Location(term[1], objs[term[2]], term[3], term[4])
+        elif kind == TERM_ADDRESS:
+            obj = Address(objs[term[1]])
+        elif kind == TERM_VALUE:
+            obj = Value()
+        elif kind == TERM_LOCKSET:
+            obj = RelativeLockset([objs[i] for i in term[1]], [objs[i] for i in term[2]])
+        elif kind == TERM_ACCESS:
+            obj = GuardedAccess(objs[term[1]], objs[term[2]], term[3], term[4], term[5])
+        else:
+            raise ValueError('Unknown summary term: {}'.format(kind))
+        objs.append(obj)
+    return objs
+
+
+def dump_summaries(summaries, entries):
+    # Encodes list of (function name, summary) pairs and thread entries
+    encoder = SummaryEncoder()
+    body = (
+        tuple((name, encoder.encode_summary(summary)) for name, summary in summaries),
+        tuple(encoder.encode_entry(entry) for entry in entries),
+    )
+    return marshal.dumps((FORMAT_VERSION, tuple(encoder.terms), body))
+
+
+def load_summaries(data):
+    version, terms, body = marshal.loads(data)
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported summary format: {}'.format(version))
+
+    objs = decode_terms(terms)
+
+    def decode_shape(shape):
+        if shape is None:
+            return None
+        return shape[0], tuple(objs[i] for i in shape[1])
+
+    summaries = []
+    for name, (lockset, accesses, formals, calls, widened) in body[0]:
+        summaries.append((name, {
+            'lockset': objs[lockset],
+            'accesses': GuardedAccessTable(set(objs[i] for i in accesses)),
+            'formals': [[objs[i] for i in chain] for chain in formals],
+            'calls': frozenset((callee, tuple(decode_shape(shape) for shape in shapes))
+                               for callee, shapes in calls),
+            'widened': widened,
+        }))
+
+    entries = []
+    for name, accesses, shape, file, line in body[1]:
+        entries.append({
+            'name': name,
+            'accesses': (GuardedAccessTable(set(objs[i] for i in accesses))
+                         if accesses is not None else None),
+            'shape': decode_shape(shape),
+            'file': file,
+            'line': line,
+        })
+
+    return summaries, entries
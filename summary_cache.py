@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from summaries import dump_summaries, load_summaries
+
+
+class SummaryCache(object):
+    # Summaries of callgraph components stored in files named by their keys.
+    # Files are touched when they are loaded and the least recently used ones
+    # are removed when the cache grows over max_size bytes.
+    SUFFIX = '.summary'
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by a parallel compilation
+                if not os.path.isdir(directory):
+                    raise
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def load(self, key):
+        # Returns (summaries, entries) stored by key or None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fi:
+                data = fi.read()
+            summaries, entries = load_summaries(data)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return summaries, entries
+
+    def store(self, key, summaries, entries):
+        data = dump_summaries(summaries, entries)
+
+        # readers never see partially written file
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fo:
+            fo.write(data)
+        os.rename(tmp, self.path(key))
+
+    def evict(self):
+        files, size = [], 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            size += stat.st_size
+
+        files.sort()
+        for mtime, fsize, path in files:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= fsize
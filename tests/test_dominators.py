@@ -0,0 +1,96 @@
+# Dominator trees of dominators.py on random graphs compared with the
+# iterative intersection of dominator sets of predecessors.
+#
+#     python -m unittest discover tests
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dominators import DominatorTree, FunctionTrees
+
+CASES = 3000
+
+
+def graph(rng):
+    # Returns number of nodes and successors of every node
+    nodes = rng.randint(1, 25)
+    return nodes, dict((node, rng.sample(range(nodes), rng.randint(0, min(3, nodes))))
+                       for node in range(nodes))
+
+
+def predecessors(nodes, succs):
+    preds = dict((node, []) for node in range(nodes))
+    for node in range(nodes):
+        for dest in succs[node]:
+            preds[dest].append(node)
+    return preds
+
+
+def naive_dominators(root, succs):
+    # Returns dominators of nodes reachable from root
+    reached, stack = set(), [root]
+    while stack:
+        node = stack.pop()
+        if node not in reached:
+            reached.add(node)
+            stack.extend(succs[node])
+
+    preds = dict((node, [pred for pred in reached if node in succs[pred]]) for node in reached)
+    dominators = dict((node, set(reached)) for node in reached)
+    dominators[root] = set([root])
+    changed = True
+    while changed:
+        changed = False
+        for node in reached:
+            if node == root:
+                continue
+            new = set.intersection(*[dominators[pred] for pred in preds[node]]) | set([node])
+            if new != dominators[node]:
+                dominators[node] = new
+                changed = True
+    return dominators
+
+
+class Block(object):
+
+    def __init__(self, index):
+        self.index = index
+
+
+class Function(object):
+    # Function with only entry and exit blocks of its cfg
+
+    def __init__(self, entry, exit):
+        self.cfg = self
+        self.entry = Block(entry)
+        self.exit = Block(exit)
+
+
+class DominatorsTest(unittest.TestCase):
+
+    def check(self, tree, dominators):
+        self.assertEqual(set(tree.idom), set(dominators))
+        for node in dominators:
+            self.assertEqual(set(tree.dominators(node)), dominators[node])
+            for other in dominators:
+                self.assertEqual(tree.dominates(other, node), other in dominators[node])
+
+    def test_dominators(self):
+        for seed in range(CASES):
+            nodes, succs = graph(random.Random(seed))
+            self.check(DominatorTree(0, succs.__getitem__), naive_dominators(0, succs))
+
+    def test_post_dominators(self):
+        for seed in range(CASES):
+            nodes, succs = graph(random.Random(seed))
+            preds = predecessors(nodes, succs)
+            trees = FunctionTrees(Function(0, nodes - 1), succs, preds)
+            self.check(trees.dominator_tree(), naive_dominators(0, succs))
+            self.check(trees.post_dominator_tree(), naive_dominators(nodes - 1, preds))
+
+
+if __name__ == '__main__':
+    unittest.main()
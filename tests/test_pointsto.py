@@ -0,0 +1,75 @@
+# Random constraint systems solved by the solvers of pointsto.py and by the
+# naive fixpoint of the constraint rules.
+#
+#     python -m unittest discover tests
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pointsto import AndersenSolver, SteensgaardSolver
+
+CASES = 3000
+KINDS = ('address', 'copy', 'load', 'store')
+
+
+def constraints(rng):
+    # Returns number of variables and list of (kind, p, q) over them
+    nodes = rng.randint(1, 12)
+    return nodes, [(rng.choice(KINDS), rng.randrange(nodes), rng.randrange(nodes))
+                   for _ in range(rng.randint(0, 3 * nodes))]
+
+
+def naive_points_to(nodes, system):
+    # Applies the rules of the constraints until no points-to set changes
+    pts = [set() for _ in range(nodes)]
+    changed = True
+    while changed:
+        changed = False
+        for kind, p, q in system:
+            if kind == 'address':
+                targets = [(p, set([q]))]
+            elif kind == 'copy':
+                targets = [(p, pts[q])]
+            elif kind == 'load':
+                targets = [(p, pts[v]) for v in pts[q]]
+            else:
+                targets = [(v, pts[q]) for v in pts[p]]
+            for node, locations in targets:
+                if not locations.issubset(pts[node]):
+                    pts[node] |= locations
+                    changed = True
+    return pts
+
+
+def solve(cls, nodes, system):
+    solver = cls()
+    ids = [solver.node(index) for index in range(nodes)]
+    for kind, p, q in system:
+        getattr(solver, kind)(ids[p], ids[q])
+    solver.solve()
+    return [set(solver.names[location] for location in solver.points_to(node)) for node in ids]
+
+
+class PointsToTest(unittest.TestCase):
+
+    def test_andersen_is_fixpoint(self):
+        for seed in range(CASES):
+            nodes, system = constraints(random.Random(seed))
+            self.assertEqual(solve(AndersenSolver, nodes, system),
+                             naive_points_to(nodes, system), 'seed {}'.format(seed))
+
+    def test_steensgaard_includes_andersen(self):
+        for seed in range(CASES):
+            nodes, system = constraints(random.Random(seed))
+            exact = solve(AndersenSolver, nodes, system)
+            unified = solve(SteensgaardSolver, nodes, system)
+            for node in range(nodes):
+                self.assertTrue(exact[node].issubset(unified[node]),
+                                'seed {}, node {}'.format(seed, node))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Merge of persistent maps of summaries.py on random maps forked from a
+# common one, compared with the merge of dicts.
+#
+#     python -m unittest discover tests
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summaries import PersistentMap
+
+CASES = 3000
+
+
+class Key(object):
+    # Key with the given hash, so that hashes collide and share prefixes
+
+    def __init__(self, hash):
+        self.hash = hash
+
+    def __hash__(self):
+        return self.hash
+
+
+def combine(value, other):
+    return value if value == other else value + other
+
+
+def fork(rng, keys, persistent, items):
+    items = dict(items)
+    for _ in range(rng.randint(0, 10)):
+        key, value = rng.choice(keys), rng.randrange(5)
+        persistent = persistent.set(key, value)
+        items[key] = value
+    return persistent, items
+
+
+class PersistentMapTest(unittest.TestCase):
+
+    def test_merge(self):
+        for seed in range(CASES):
+            rng = random.Random(seed)
+            keys = [Key(rng.choice([rng.randrange(1 << 40), -rng.randrange(1 << 40), rng.randrange(8)]))
+                    for _ in range(rng.randint(1, 60))]
+            base, items = PersistentMap(), {}
+            for key in keys:
+                if rng.random() < 0.5:
+                    items[key] = rng.randrange(5)
+                    base = base.set(key, items[key])
+            first, first_items = fork(rng, keys, base, items)
+            second, second_items = fork(rng, keys, base, items)
+
+            merged, expected = first.merge(second, combine), dict(first_items)
+            for key, value in second_items.items():
+                expected[key] = combine(expected[key], value) if key in expected else value
+            self.assertEqual(dict(merged.items()), expected, 'seed {}'.format(seed))
+            for key in keys:
+                self.assertEqual(merged.get(key), expected.get(key), 'seed {}'.format(seed))
+            if expected == first_items:
+                self.assertTrue(merged is first, 'seed {}'.format(seed))
+            self.assertTrue(first.merge(first, combine) is first)
+
+
+if __name__ == '__main__':
+    unittest.main()